@@ -1,5 +1,14 @@
 from typing import List, Dict, Tuple, Callable, Any
+import itertools
+import json
+import math
 import enum
+import heapq
+import time
+import multiprocessing
+import threading
+from collections import OrderedDict
+import numpy as np
 
 names_given = 0
 def next_name():
@@ -9,6 +18,28 @@ def next_name():
 
 Assignment = List[bool]
 
+def safe_log(p: float) -> float:
+    return math.log(p) if p > 0 else -math.inf
+
+def log_add(a: float, b: float) -> float:
+    """log(exp(a) + exp(b)) without leaving log space."""
+    if a < b:
+        a, b = b, a
+    if b == -math.inf:
+        return a
+    return a + math.log1p(math.exp(b - a))
+
+def logsumexp(a: np.ndarray, axis=None) -> np.ndarray:
+    """log(sum(exp(a))) along axis, shifted by the maximum so it neither
+    overflows nor underflows. Slices that are all -inf give -inf."""
+    m = np.max(a, axis=axis, keepdims=True)
+    m = np.where(np.isfinite(m), m, 0.0)
+    with np.errstate(divide="ignore"):
+        s = np.log(np.sum(np.exp(a - m), axis=axis, keepdims=True)) + m
+    if axis is None:
+        return s.reshape(())
+    return np.squeeze(s, axis=axis)
+
 def indexify(assignment: Assignment) -> int:
     """Convert a tuple of bools into an index for the final column
     of the corresponding truth table, conventionally ordered.
@@ -37,8 +68,19 @@ class Discrete_CDT:
     # TODO: if I made the second argument a dict, I could extract the third. But this may be less extensible. 
     def __init__(self, parents: List[Variable_Node], dists: Callable[[Tuple], Discrete_Dist], values: List):
         self.parents = parents
-        self.dists = dists
         self.values = values
+        # The Tabular_CDT made by tabulate, dropped whenever dists is set
+        self.tabular = None
+        self.dists = dists
+
+    @property
+    def dists(self) -> Callable[[Tuple], Discrete_Dist]:
+        return self.dist_function
+
+    @dists.setter
+    def dists(self, dists: Callable[[Tuple], Discrete_Dist]):
+        self.dist_function = dists
+        self.tabular = None
 
     def __call__(self, pvalues: Tuple) -> Discrete_Dist:
         return self.dists(pvalues)
@@ -80,6 +122,77 @@ class Discrete_CDT:
     def evaluate_fully_conditioned(self):
         return self.dists(tuple([p.value for p in self.parents]))
 
+    def prob(self, pvalues: Tuple, value) -> float:
+        return self.dists(pvalues)[value]
+
+    def log_prob(self, pvalues: Tuple, value) -> float:
+        return safe_log(self.prob(pvalues, value))
+
+    def evaluate_conditioned(self, pvalues: Tuple) -> Discrete_Dist:
+        """
+        evaluate_fully_conditioned for the parent values given, in the
+        order of self.parents, instead of each parent's value attribute,
+        so queries that each carry their own values can run side by side.
+        prob(pvalues, value) is the matching single probability, which
+        Bayes_Net.conditioned_prob looks up for id-indexed assignments.
+        """
+        return self.dists(tuple(pvalues))
+
+    def tabulate(self) -> "Tabular_CDT":
+        """
+        Evaluate dists once for every assignment to the parents and keep
+        the results as a dense array. The table is built on the first call
+        and reused until dists is replaced.
+        """
+        if self.tabular is None:
+            shape = [len(p.get_values()) for p in self.parents] + [len(self.values)]
+            table = np.empty(shape)
+            for index in itertools.product(*[range(n) for n in shape[:-1]]):
+                condition = tuple([p.get_values()[i] for p, i in zip(self.parents, index)])
+                dist = self.dists(condition)
+                table[index] = [dist[v] for v in self.values]
+            self.tabular = Tabular_CDT(self.parents, table, self.values)
+        return self.tabular
+
+class Tabular_CDT(Discrete_CDT):
+    """
+    A Discrete_CDT stored as an array with one axis per parent followed by
+    an axis for the node's own value, each indexed by value ordinal.
+    Lookups are array indexing instead of calls to a distribution function.
+    """
+    def __init__(self, parents: List[Variable_Node], table: np.ndarray, values: List):
+        self.parents = parents
+        self.table = table
+        self.values = values
+        self.index = {v: i for i, v in enumerate(values)}
+        self.parent_index = [{v: i for i, v in enumerate(p.get_values())} for p in parents]
+        self.logs = None
+
+    @property
+    def log_table(self) -> np.ndarray:
+        """Natural log of table, computed on first use so that a table
+        mapped from disk is not copied unless log space is needed."""
+        if self.logs is None:
+            with np.errstate(divide="ignore"):
+                self.logs = np.log(self.table)
+        return self.logs
+
+    def ordinals(self, pvalues: Tuple) -> Tuple[int, ...]:
+        return tuple([ind[v] for ind, v in zip(self.parent_index, pvalues)])
+
+    def dists(self, pvalues: Tuple) -> Discrete_Dist:
+        row = self.table[self.ordinals(pvalues)]
+        return {v: row[i] for i, v in enumerate(self.values)}
+
+    def prob(self, pvalues: Tuple, value) -> float:
+        return self.table[self.ordinals(pvalues) + (self.index[value],)]
+
+    def log_prob(self, pvalues: Tuple, value) -> float:
+        return self.log_table[self.ordinals(pvalues) + (self.index[value],)]
+
+    def tabulate(self) -> "Tabular_CDT":
+        return self
+
 
 
 #CDT = List[float]
@@ -125,24 +238,46 @@ class Color(enum.Enum):
     GRAY  = 1
     BLACK = 2
 
+Tracer = Callable[[str], None]
+
 class Painter:
-    def __init__(self, nodes : List[Variable_Node]):
+    """Colors nodes for a depth first search. Pass trace=print (or any
+    function taking a message) to follow the search step by step."""
+    def __init__(self, nodes : List[Variable_Node], trace : Tracer = None):
         self.colors = dict()
         for n in nodes:
             self.colors[n] = Color.WHITE
+        self.tracer = trace
     def paint(self, n : Variable_Node, color : Color):
-        print("Painting node %s %s" % (n.name, color.name))
+        if self.tracer is not None:
+            self.tracer("Painting node %s %s" % (n.name, color.name))
         self.colors[n] = color
     def color(self, n : Variable_Node):
         return self.colors[n]
 
 def DFS_VISIT(n : Variable_Node, painter : Painter):
+    """
+    Depth first search from n with an explicit stack, so long chains do not
+    hit the recursion limit. Reaching a GRAY node again means the graph has
+    a cycle.
+    """
     painter.paint(n, Color.GRAY)
-    for c in n.children:
-        if painter.color(c) == Color.WHITE:
-            print("Node %s is white, will visit" % c.name)
-            DFS_VISIT(c, painter)
-    painter.paint(n, Color.BLACK)
+    stack = [(n, iter(n.children))]
+    while stack:
+        node, children = stack[-1]
+        for c in children:
+            color = painter.color(c)
+            if color == Color.WHITE:
+                if painter.tracer is not None:
+                    painter.tracer("Node %s is white, will visit" % c.name)
+                painter.paint(c, Color.GRAY)
+                stack.append((c, iter(c.children)))
+                break
+            elif color == Color.GRAY:
+                raise Exception("Cycle through node %s" % c.name)
+        else:
+            stack.pop()
+            painter.paint(node, Color.BLACK)
 
 def DFS(nodes : List[Variable_Node], painter : Painter):
     for n in nodes:
@@ -150,9 +285,9 @@ def DFS(nodes : List[Variable_Node], painter : Painter):
             DFS_VISIT(n, painter)
 
 class TopSortPainter(Painter):
-    def __init__(self, nodes : List[Variable_Node]):
+    def __init__(self, nodes : List[Variable_Node], trace : Tracer = None):
         self.sorted = []
-        super().__init__(nodes)
+        super().__init__(nodes, trace)
 
     def paint(self, n : Variable_Node, color : Color):
         if color == Color.BLACK:
@@ -163,11 +298,21 @@ class TopSortPainter(Painter):
         self.sorted.reverse()
         return self.sorted
     
-def TOPSORT(nodes : List[Variable_Node]):
-    tsp = TopSortPainter(nodes)
+def TOPSORT(nodes : List[Variable_Node], trace : Tracer = None):
+    tsp = TopSortPainter(nodes, trace)
     DFS(nodes, tsp)
     return tsp.get_sorted()
 
+def is_topological(nodes : List[Variable_Node]) -> bool:
+    """Whether every node in the list comes after all of its parents."""
+    seen = set()
+    for n in nodes:
+        for p in n.parents:
+            if p not in seen:
+                return False
+        seen.add(n)
+    return True
+
     # TODO: dict is used instead of set because soon any discrete values
     # will be allowed.
     # def fully_conditioned_dist(self, parent_vals: Dict[str, bool]):
@@ -179,67 +324,961 @@ def TOPSORT(nodes : List[Variable_Node]):
     # def get_value_names(self):
     #     return self.cdt.vals
 
+
+class Factor:
+    """
+    A nonnegative table over some variables, with one axis per variable.
+    Each axis is indexed by the position of a value in that variable's
+    list of values.
+    """
+    def __init__(self, vars: List[Variable_Node], table: np.ndarray):
+        self.vars = vars
+        self.table = table
+
+    def __repr__(self):
+        return "Factor(%s)" % (" ".join([v.name for v in self.vars]))
+
+    def expand(self, vars: List[Variable_Node]) -> np.ndarray:
+        """View the table over vars (a superset of self.vars), broadcasting
+        along the missing axes."""
+        order = sorted(range(len(self.vars)), key=lambda i: vars.index(self.vars[i]))
+        table = self.table.transpose(order)
+        present = set(self.vars)
+        shape = [len(v.get_values()) if v in present else 1 for v in vars]
+        return table.reshape(shape)
+
+    def multiply(self, other: "Factor") -> "Factor":
+        vars = self.vars + [v for v in other.vars if v not in self.vars]
+        return type(self)(vars, self.expand(vars)*other.expand(vars))
+
+    def sum_out(self, var: Variable_Node) -> "Factor":
+        i = self.vars.index(var)
+        return type(self)(self.vars[:i] + self.vars[i+1:], self.table.sum(axis=i))
+
+    def restrict(self, var: Variable_Node, value: Any) -> "Factor":
+        """Fix var to value, dropping its axis."""
+        i = self.vars.index(var)
+        j = var.get_values().index(value)
+        return type(self)(self.vars[:i] + self.vars[i+1:], np.take(self.table, j, axis=i))
+
+class Log_Factor(Factor):
+    """
+    A Factor holding the natural logs of its entries. Products become sums
+    and summing out becomes log-sum-exp, so long products of small
+    probabilities do not underflow.
+    """
+    def multiply(self, other: "Log_Factor") -> "Log_Factor":
+        vars = self.vars + [v for v in other.vars if v not in self.vars]
+        return Log_Factor(vars, self.expand(vars) + other.expand(vars))
+
+    def sum_out(self, var: Variable_Node) -> "Log_Factor":
+        i = self.vars.index(var)
+        return Log_Factor(self.vars[:i] + self.vars[i+1:], logsumexp(self.table, axis=i))
+
+def node_factor(node: Variable_Node) -> Factor:
+    """The factor P(node | parents) built from the node's tabulated CDT."""
+    cdt = node.cdt.tabulate()
+    return Factor(cdt.parents + [node], cdt.table)
+
+def node_log_factor(node: Variable_Node) -> Log_Factor:
+    """The log of node_factor(node)."""
+    cdt = node.cdt.tabulate()
+    return Log_Factor(cdt.parents + [node], cdt.log_table)
+
+def interaction_graph(factors: List[Factor]) -> Dict[Variable_Node, set]:
+    """Variables are adjacent when they appear in a common factor."""
+    graph = dict()
+    for f in factors:
+        for v in f.vars:
+            graph.setdefault(v, set()).update(f.vars)
+    for v in graph.keys():
+        graph[v].discard(v)
+    return graph
+
+# Elimination order heuristics. Each picks the next variable to eliminate
+# from candidates given the factors that remain; ties go to the earliest candidate.
+
+def min_degree(factors: List[Factor], candidates: List[Variable_Node]) -> Variable_Node:
+    graph = interaction_graph(factors)
+    return min(candidates, key=lambda v: len(graph.get(v, ())))
+
+def min_fill(factors: List[Factor], candidates: List[Variable_Node]) -> Variable_Node:
+    graph = interaction_graph(factors)
+    def fill(v):
+        neighbors = list(graph.get(v, ()))
+        count = 0
+        for i, a in enumerate(neighbors):
+            for b in neighbors[i+1:]:
+                if b not in graph[a]:
+                    count += 1
+        return count
+    return min(candidates, key=fill)
+
+EliminationHeuristic = Callable[[List[Factor], List[Variable_Node]], Variable_Node]
+
+def greedy_elimination(
+    graph: Dict[Variable_Node, set],
+    candidates: List[Variable_Node],
+    heuristic: EliminationHeuristic,
+) -> List[Tuple[Variable_Node, set]]:
+    """
+    Eliminate the candidates from graph, an interaction graph that is
+    changed in place, in the order min_fill or min_degree (the heuristic)
+    would pick them, and return each with its neighbors when it went.
+    Instead of scoring every candidate at every step, the scores are kept
+    up to date around each elimination and the next candidate comes off a
+    heap, so a step costs about as much as the cluster it forms.
+    """
+    position = {v: i for i, v in enumerate(candidates)}
+    for v in candidates:
+        graph.setdefault(v, set())
+    def score(v):
+        neighbors = list(graph[v])
+        if heuristic is min_degree:
+            return len(neighbors)
+        count = 0
+        for i, a in enumerate(neighbors):
+            for b in neighbors[i+1:]:
+                if b not in graph[a]:
+                    count += 1
+        return count
+    current = {v: score(v) for v in candidates}
+    heap = [(current[v], position[v], v) for v in candidates]
+    heapq.heapify(heap)
+    eliminated = []
+    while heap:
+        s, i, var = heapq.heappop(heap)
+        if var not in graph or current[var] != s:
+            continue
+        neighbors = graph.pop(var)
+        eliminated.append((var, neighbors))
+        for a in neighbors:
+            graph[a].discard(var)
+            graph[a].update(neighbors)
+            graph[a].discard(a)
+        # Fill counts can change up to two steps away, degrees one
+        affected = set(neighbors)
+        if heuristic is min_fill:
+            for a in neighbors:
+                affected.update(graph[a])
+        for a in affected:
+            if a not in position:
+                continue
+            s = score(a)
+            if s != current[a]:
+                current[a] = s
+                heapq.heappush(heap, (s, position[a], a))
+    return eliminated
+
+def eliminate(factors: List[Factor], var: Variable_Node) -> List[Factor]:
+    """Multiply the factors mentioning var together and sum it out."""
+    touching = [f for f in factors if var in f.vars]
+    rest = [f for f in factors if var not in f.vars]
+    if not touching:
+        return rest
+    product = touching[0]
+    for f in touching[1:]:
+        product = product.multiply(f)
+    return rest + [product.sum_out(var)]
+
+def eliminate_in_order(factors: List[Factor], order: List[Variable_Node]) -> List[Factor]:
+    """
+    Same as calling eliminate for each variable of order in turn, finding
+    the factors that mention it from an index by variable instead of
+    scanning all of them.
+    """
+    live = dict(enumerate(factors))
+    mentioning = dict()
+    for k, f in live.items():
+        for v in f.vars:
+            mentioning.setdefault(v, set()).add(k)
+    next_key = len(factors)
+    for var in order:
+        keys = sorted(mentioning.pop(var, ()))
+        if not keys:
+            continue
+        touching = [live.pop(k) for k in keys]
+        for k, f in zip(keys, touching):
+            for v in f.vars:
+                if v is not var:
+                    mentioning[v].discard(k)
+        product = touching[0]
+        for f in touching[1:]:
+            product = product.multiply(f)
+        live[next_key] = product.sum_out(var)
+        for v in live[next_key].vars:
+            mentioning.setdefault(v, set()).add(next_key)
+        next_key += 1
+    return list(live.values())
+
+def normalize_log_dist(log_dist: Dict[Any, float]) -> Dict[Any, float]:
+    """Turn unnormalized log weights into probabilities."""
+    mag = logsumexp(np.array(list(log_dist.values())))
+    return {v: float(np.exp(l - mag)) for v, l in log_dist.items()}
+
+def sample_categorical(rng: np.random.Generator, weights: np.ndarray) -> np.ndarray:
+    """Draw one ordinal per row of an (N x k) array of unnormalized weights."""
+    cumulative = weights.cumsum(axis=1)
+    u = rng.random(len(weights))*cumulative[:, -1]
+    return np.minimum((cumulative <= u[:, None]).sum(axis=1), weights.shape[1]-1)
+
+def cdt_rows(table: np.ndarray, indices: np.ndarray, columns: List[int]) -> np.ndarray:
+    """The rows of a tabulated CDT picked out by the parent ordinals in the
+    given columns of indices, as an (N x k) array."""
+    rows = table[tuple([indices[:, c] for c in columns])]
+    return np.broadcast_to(rows, (len(indices), table.shape[-1]))
+
+class Sample_Budget:
+    """Stops a sampler after a number of samples or a number of seconds,
+    whichever comes first. With neither given, default_samples are drawn."""
+    default_samples = 100000
+    def __init__(self, samples: int = None, seconds: float = None):
+        if samples is None and seconds is None:
+            samples = Sample_Budget.default_samples
+        self.samples = samples
+        self.deadline = None if seconds is None else time.time() + seconds
+        self.drawn = 0
+
+    def batch(self, batch_size: int) -> int:
+        """Size of the next batch, or 0 once the budget is spent."""
+        if self.deadline is not None and time.time() >= self.deadline:
+            return 0
+        if self.samples is None:
+            return batch_size
+        return max(0, min(batch_size, self.samples - self.drawn))
+
 class Bayes_Net:
-    def __init__(self, nodes: List[Variable_Node]):
-        self.nodes = TOPSORT(nodes)
+    """
+    Nodes are kept in topological order, and a node's position in
+    self.nodes is its integer id within the net. Assignments passed between
+    the query methods are lists indexed by id, and evidence is a mask
+    with one flag per id.
+    """
+    def __init__(self, nodes: List[Variable_Node], trace : Tracer = None, ordered : bool = False):
+        # With ordered, nodes are taken to be in topological order already
+        # and keep it, so ids survive spec, save and load
+        if ordered:
+            if not is_topological(nodes):
+                raise Exception("Nodes are not in topological order")
+            self.nodes = list(nodes)
+        else:
+            self.nodes = TOPSORT(nodes, trace)
+        self.index = {n.name: i for i, n in enumerate(self.nodes)}
+        if len(self.index) < len(self.nodes):
+            names = [n.name for n in self.nodes]
+            raise Exception("Duplicate node name %s" % [name for name in names if names.count(name) > 1][0])
+        # For each node, the ids of its parents
+        self.parent_columns = [[self.index[p.name] for p in n.parents] for n in self.nodes]
+        # Pruned nets, with the CDTs they were built from, by query variable
+        # and evidence names, least recently used first (see prune)
+        self.pruned = OrderedDict()
+        self.pruned_capacity = 256
+        self.pruned_lock = threading.Lock()
+
+    def node(self, name : str) -> Variable_Node:
+        return self.nodes[self.index[name]]
+
+    def evidence_mask(self, e : Dict[str, Any]) -> List[bool]:
+        """For each node id, whether e fixes that node's value."""
+        mask = [False]*len(self.nodes)
+        for name in e.keys():
+            mask[self.index[name]] = True
+        return mask
+
+    def assignment_list(self, e : Dict[str, Any]) -> List[Any]:
+        """e as a list indexed by node id, with None where e is silent."""
+        assignment = [None]*len(self.nodes)
+        for name, value in e.items():
+            assignment[self.index[name]] = value
+        return assignment
+
+    def conditioned_prob(self, i : int, assignment : List[Any]) -> float:
+        """Probability of node i's value in assignment given its parents' values there."""
+        return self.nodes[i].cdt.prob(tuple([assignment[j] for j in self.parent_columns[i]]), assignment[i])
+
+    def conditioned_log_prob(self, i : int, assignment : List[Any]) -> float:
+        return self.nodes[i].cdt.log_prob(tuple([assignment[j] for j in self.parent_columns[i]]), assignment[i])
+
+    def tabulate(self):
+        """Replace every node's CDT by its tabulated form."""
+        for n in self.nodes:
+            n.cdt = n.cdt.tabulate()
+
+    def fit(self, data, alpha : float = 0.0) -> "Bayes_Net":
+        """
+        Set every CDT from data by counting. data is an (N x number of
+        nodes) array of value ordinals with columns in id order, as for
+        P_batch, or an iterable of such arrays for data that does not fit
+        in memory; it is read once. Each node's counts over (parent values,
+        value) are gathered with one bincount per chunk. With alpha > 0,
+        alpha pseudo-counts are added to every entry (a symmetric Dirichlet
+        prior); otherwise this is the maximum likelihood estimate. Parent
+        assignments never seen get a uniform row.
+        """
+        if isinstance(data, np.ndarray):
+            data = [data]
+        shapes = [
+            tuple([len(self.nodes[j].get_values()) for j in self.parent_columns[i]] + [len(n.get_values())])
+            for i, n in enumerate(self.nodes)
+        ]
+        counts = [np.zeros(int(np.prod(shape))) for shape in shapes]
+        for chunk in data:
+            chunk = np.asarray(chunk)
+            for i in range(len(self.nodes)):
+                columns = self.parent_columns[i] + [i]
+                flat = np.ravel_multi_index(tuple([chunk[:, c] for c in columns]), shapes[i])
+                counts[i] += np.bincount(flat, minlength=len(counts[i]))
+        for i, n in enumerate(self.nodes):
+            table = counts[i].reshape(shapes[i]) + alpha
+            totals = table.sum(axis=-1, keepdims=True)
+            table = np.where(totals > 0, table/np.where(totals > 0, totals, 1), 1.0/shapes[i][-1])
+            n.cdt = Tabular_CDT(n.parents, table, n.get_values())
+        with self.pruned_lock:
+            self.pruned.clear()
+        return self
+
+    def spec(self) -> List[Tuple[str, List, List[int], np.ndarray]]:
+        """
+        A picklable description of the net: for each node in order, its
+        name, values, parent positions and tabulated CDT.
+        """
+        return [
+            (n.name, n.get_values(), columns, n.cdt.tabulate().table)
+            for n, columns in zip(self.nodes, self.parent_columns)
+        ]
+
+    @staticmethod
+    def from_spec(spec: List[Tuple[str, List, List[int], np.ndarray]]) -> "Bayes_Net":
+        """Rebuild a net with Tabular_CDTs from the output of spec()."""
+        nodes = []
+        for name, values, columns, table in spec:
+            parents = [nodes[c] for c in columns]
+            nodes.append(Variable_Node(Tabular_CDT(parents, table, values), name=name))
+        return Bayes_Net(nodes, ordered=True)
+
+    # File layout for save and load: the magic bytes, the length of a
+    # UTF-8 JSON header as a little-endian uint64, the header, zero
+    # padding up to a multiple of 64 bytes, then every CDT table as
+    # little-endian float64 in C order, one after another. The header
+    # lists each node's name, values, parent ids, table shape and the
+    # offset of its table (in floats) from the start of the block.
+    file_magic = b"BAYESNET1"
+
+    def save(self, path : str):
+        """Write the net in the binary format described above. Values must
+        be JSON serializable."""
+        header = []
+        offset = 0
+        for i, n in enumerate(self.nodes):
+            table = n.cdt.tabulate().table
+            header.append({
+                "name": n.name,
+                "values": n.get_values(),
+                "parents": self.parent_columns[i],
+                "shape": list(table.shape),
+                "offset": offset,
+            })
+            offset += table.size
+        encoded = json.dumps(header).encode("utf-8")
+        start = len(Bayes_Net.file_magic) + 8 + len(encoded)
+        padding = -start % 64
+        with open(path, "wb") as f:
+            f.write(Bayes_Net.file_magic)
+            f.write(np.uint64(len(encoded)).astype("<u8").tobytes())
+            f.write(encoded)
+            f.write(bytes(padding))
+            for n in self.nodes:
+                f.write(np.ascontiguousarray(n.cdt.tabulate().table, dtype="<f8").tobytes())
+
+    @staticmethod
+    def load(path : str, mmap : bool = True) -> "Bayes_Net":
+        """
+        Read a net written by save. With mmap, the CDT tables are read-only
+        views of a memory map of the file, so loading does not read them
+        and processes that load the same file share one copy in the page
+        cache.
+        """
+        with open(path, "rb") as f:
+            if f.read(len(Bayes_Net.file_magic)) != Bayes_Net.file_magic:
+                raise Exception("%s is not a saved Bayes_Net" % path)
+            length = int(np.frombuffer(f.read(8), dtype="<u8")[0])
+            header = json.loads(f.read(length).decode("utf-8"))
+        start = len(Bayes_Net.file_magic) + 8 + length
+        start += -start % 64
+        total = sum([int(np.prod(h["shape"])) for h in header])
+        if mmap:
+            block = np.memmap(path, dtype="<f8", mode="r", offset=start, shape=(total,))
+        else:
+            block = np.fromfile(path, dtype="<f8", count=total, offset=start)
+        spec = []
+        for h in header:
+            size = int(np.prod(h["shape"]))
+            table = block[h["offset"]:h["offset"]+size].reshape(h["shape"])
+            spec.append((h["name"], h["values"], h["parents"], table))
+        return Bayes_Net.from_spec(spec)
+
+    def bayes_ball(self, X : str, e : Dict[str, Any]) -> Tuple[set, set]:
+        """
+        Shachter's Bayes-ball from X given the evidence names in e.
+        Returns the requisite nodes, whose CDTs can change P(X | e), and
+        the requisite observations, whose values can. Every other node is
+        barren or d-separated from X by e.
+        """
+        members = set(self.nodes)
+        top = set()
+        bottom = set()
+        visited = set()
+        # Each entry is a node and whether the ball arrived from a child
+        schedule = [(self.node(X), True)]
+        while schedule:
+            n, from_child = schedule.pop()
+            visited.add(n)
+            observed = n.name in e.keys()
+            if from_child and not observed:
+                if n not in top:
+                    top.add(n)
+                    schedule.extend([(p, True) for p in n.parents])
+                if n not in bottom:
+                    bottom.add(n)
+                    schedule.extend([(c, False) for c in n.children if c in members])
+            elif not from_child:
+                if observed and n not in top:
+                    top.add(n)
+                    schedule.extend([(p, True) for p in n.parents])
+                if not observed and n not in bottom:
+                    bottom.add(n)
+                    schedule.extend([(c, False) for c in n.children if c in members])
+        return top, set([n for n in visited if n.name in e.keys()])
+
+    def prune(self, X : str, e : Dict[str, Any]) -> Tuple["Bayes_Net", Dict[str, Any]]:
+        """
+        The smallest net that gives the same posterior for X given e, with
+        the evidence that still matters. It holds the requisite nodes of
+        bayes_ball, with their tabulated CDTs, and the requisite
+        observations whose own CDTs do not matter as parentless nodes with
+        uniform tables. The net only depends on X, the names in e and the
+        CDTs of the requisite nodes, so the most recently used ones are kept
+        and shared by later queries, and one is built again once any of
+        those CDTs has been replaced (or, for a Discrete_CDT, its dists).
+        """
+        key = (X, frozenset(e.keys()))
+        with self.pruned_lock:
+            entry = self.pruned.get(key)
+            if entry is not None:
+                self.pruned.move_to_end(key)
+        if entry is None or any([n.cdt.tabulate() is not cdt for n, cdt in entry[1]]):
+            entry = self.build_pruned(X, e)
+            with self.pruned_lock:
+                self.pruned[key] = entry
+                if len(self.pruned) > self.pruned_capacity:
+                    self.pruned.popitem(last=False)
+        bn = entry[0]
+        return bn, {n.name: e[n.name] for n in bn.nodes if n.name in e.keys()}
+
+    def build_pruned(self, X : str, e : Dict[str, Any]) -> Tuple["Bayes_Net", List[Tuple[Variable_Node, "Tabular_CDT"]]]:
+        """The net of prune, with each requisite node and the tabulated
+        CDT its copy was made from."""
+        requisite, observations = self.bayes_ball(X, e)
+        copies = dict()
+        sources = []
+        for n in self.nodes:
+            if n in requisite:
+                cdt = n.cdt.tabulate()
+                sources.append((n, cdt))
+                copies[n] = Variable_Node(Tabular_CDT([copies[p] for p in n.parents], cdt.table, cdt.values), name=n.name)
+            elif n in observations:
+                table = np.ones(len(n.get_values()))/len(n.get_values())
+                copies[n] = Variable_Node(Tabular_CDT([], table, n.get_values()), name=n.name)
+        return Bayes_Net([copies[n] for n in self.nodes if n in copies], ordered=True), sources
+
+    def ask_many(
+        self,
+        queries : List[Tuple[str, Dict[str, Any]]],
+        workers : int = None,
+        method : str = "variable_elimination_ask",
+        chunksize : int = None,
+        path : str = None,
+    ) -> List[Dict[Any, float]]:
+        """
+        Answer a list of (X, e) queries with the named query method, spread
+        over a pool of worker processes (one per core by default). Each
+        worker rebuilds the net once from spec(), so CDTs need not be
+        picklable and are not shipped with every query. If path names a
+        file written by save, workers memory-map it instead and share its
+        tables. Results come back in the order of queries. The query
+        methods prune by default, and each worker keeps its own pruned nets.
+        """
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        if workers <= 1:
+            return [getattr(self, method)(X, e) for X, e in queries]
+        if chunksize is None:
+            chunksize = max(1, len(queries)//(4*workers))
+        source = self.spec() if path is None else path
+        with multiprocessing.Pool(workers, init_ask_worker, (source, method)) as pool:
+            return pool.map(ask_worker, queries, chunksize)
 
     def P(self, values: List[Any], cond=[]):
-        for i, node in enumerate(self.nodes):
-            node.value = values[i]
         p = 1
-        for node in self.nodes:
-            p *= node.get_fully_conditioned_dist()[node.value]
+        for i in range(len(self.nodes)):
+            p *= self.conditioned_prob(i, values)
         # if cond:
         #     return p/self.P(values.extend(cond)) 
         return p
+
+    def log_P(self, values: List[Any]) -> float:
+        """Natural log of P(values), accumulated as a sum of logs."""
+        lp = 0.0
+        for i in range(len(self.nodes)):
+            lp += self.conditioned_log_prob(i, values)
+        return lp
     
-    def enumeration_ask(self, X : str, e : Dict[str, Any]):
+    def gather_batch(self, indices: np.ndarray):
+        """
+        For each node, yield the probabilities of its rows in indices,
+        an (N x number of nodes) array of value ordinals with columns in
+        the order of self.nodes.
+        """
+        indices = np.asarray(indices)
+        for i, node in enumerate(self.nodes):
+            table = node.cdt.tabulate().table
+            columns = self.parent_columns[i] + [i]
+            yield table[tuple([indices[:, c] for c in columns])]
+
+    def P_batch(self, indices: np.ndarray) -> np.ndarray:
+        """Joint probability of every row of indices, see gather_batch."""
+        p = np.ones(len(indices))
+        for probs in self.gather_batch(indices):
+            p *= probs
+        return p
+
+    def log_P_batch(self, indices: np.ndarray) -> np.ndarray:
+        """Natural log of P_batch, summed per node so it does not underflow."""
+        logp = np.zeros(len(indices))
+        with np.errstate(divide="ignore"):
+            for probs in self.gather_batch(indices):
+                logp += np.log(probs)
+        return logp
+
+    def enumeration_ask(
+        self,
+        X : str,
+        e : Dict[str, Any],
+        memoize : bool = False,
+        log_space : bool = False,
+        prune : bool = True,
+    ):
         """
         Return a posterior distribution for X given the assignments in e. 
         Each variable is referred to by name. 
+        With memoize, each suffix sum is cached on the values it depends
+        on (see enumerate_cached), once for the whole query.
+        With log_space, sums are accumulated as logs (log_enumerate_ids),
+        which keeps deep nets from underflowing to a 0/0 normalization.
+        No node's value attribute is touched, so one net can answer
+        several queries at once from different threads.
+        Unless prune is False, the query runs on self.prune(X, e) instead;
+        the same holds for the other query methods.
         """
-        x = None
-        for n in self.nodes:
-            if n.name == X:
-                x = n
-            if n.name in e.keys():
-                n.value = e[n.name]
-        possible_values = x.get_values()
+        if prune and X not in e.keys():
+            bn, e = self.prune(X, e)
+            return bn.enumeration_ask(X, e, memoize, log_space, prune=False)
+        x = self.index[X]
+        possible_values = self.nodes[x].get_values()
         dist = dict()
-        if x.name in e.keys():
+        if X in e.keys():
             for v in possible_values:
-                if v == x.value:
+                if v == e[X]:
                     dist[v] = 1.0
                 else:
                     dist[v] = 0.0
             return dist
         else:
+            mask = self.evidence_mask(e)
+            # x is currently being conditioned on
+            # so its value should not summed over
+            mask[x] = True
+            assignment = self.assignment_list(e)
+            ids = list(range(len(self.nodes)))
+            # With every other node fixed there is nothing to sum, and so
+            # nothing for a cache to share
+            memoize = memoize and not all(mask)
+            if memoize:
+                # One cache for the whole query: the branches for each
+                # value of X share every suffix that does not depend on X.
+                # When no suffix can be shared, plain enumeration is cheaper
+                contexts = self.suffix_contexts(mask, x)
+                cache = dict()
+                memoize = any([c is not None for c in contexts])
             for v in possible_values:
-                ep = e.copy()
-                # x is currently being conditioned on
-                # so its value should not summed over
-                ep[x.name] = x.value 
-                x.value = v
-                dist[v] = self.enumerate_all(self.nodes, ep)
+                assignment[x] = v
+                if memoize:
+                    dist[v] = self.enumerate_cached(mask, assignment, log_space, contexts, cache)
+                elif log_space:
+                    dist[v] = self.log_enumerate_ids(ids, 0, mask, assignment)
+                else:
+                    dist[v] = self.enumerate_ids(ids, 0, mask, assignment)
+        if log_space:
+            return normalize_log_dist(dist)
         mag = sum(dist.values())
         for v in dist.keys():
             dist[v] = dist[v]/mag
         return dist
     
+    def variable_elimination_ask(
+        self,
+        X : str,
+        e : Dict[str, Any],
+        heuristic : EliminationHeuristic = min_fill,
+        log_space : bool = False,
+        prune : bool = True,
+    ):
+        """
+        Return the same posterior as enumeration_ask, computed by variable
+        elimination. Hidden variables are summed out one at a time in the
+        order chosen by heuristic, so the cost grows with the width of that
+        ordering rather than the number of nodes. The orders of min_fill
+        and min_degree are found by greedy_elimination; any other heuristic
+        is handed all remaining factors at every step.
+        With log_space, the factors are Log_Factors.
+        """
+        if prune and X not in e.keys():
+            bn, e = self.prune(X, e)
+            return bn.variable_elimination_ask(X, e, heuristic, log_space, prune=False)
+        x = self.node(X)
+        possible_values = x.get_values()
+        if X in e.keys():
+            return {v: (1.0 if v == e[X] else 0.0) for v in possible_values}
+        mask = self.evidence_mask(e)
+        factors = []
+        for i, n in enumerate(self.nodes):
+            f = node_log_factor(n) if log_space else node_factor(n)
+            for j in self.parent_columns[i] + [i]:
+                if mask[j]:
+                    f = f.restrict(self.nodes[j], e[self.nodes[j].name])
+            factors.append(f)
+        hidden = [n for i, n in enumerate(self.nodes) if n is not x and not mask[i]]
+        if heuristic is min_fill or heuristic is min_degree:
+            order = [var for var, neighbors in greedy_elimination(interaction_graph(factors), hidden, heuristic)]
+            factors = eliminate_in_order(factors, order)
+        else:
+            while hidden:
+                var = heuristic(factors, hidden)
+                hidden.remove(var)
+                factors = eliminate(factors, var)
+        if log_space:
+            result = Log_Factor([x], np.zeros(len(possible_values)))
+        else:
+            result = Factor([x], np.ones(len(possible_values)))
+        for f in factors:
+            result = result.multiply(f)
+        table = result.expand([x])
+        if log_space:
+            return normalize_log_dist({v: table[i] for i, v in enumerate(possible_values)})
+        mag = table.sum()
+        return {v: table[i]/mag for i, v in enumerate(possible_values)}
+
+    def likelihood_weighting_ask(
+        self,
+        X : str,
+        e : Dict[str, Any],
+        samples : int = None,
+        seconds : float = None,
+        batch_size : int = 100000,
+        seed = None,
+        prune : bool = True,
+    ) -> Tuple[Dict[Any, float], float]:
+        """
+        Approximate posterior for X given e by likelihood weighting.
+        Samples are drawn batch_size at a time, forward through the
+        topological order, with evidence clamped and each sample weighted
+        by the likelihood of the evidence. Stops after samples draws or
+        seconds of wall-clock time, but always draws at least one batch.
+        Returns the posterior and the effective sample size
+        (sum w)^2 / sum w^2.
+        """
+        if prune and X not in e.keys():
+            bn, e = self.prune(X, e)
+            return bn.likelihood_weighting_ask(X, e, samples, seconds, batch_size, seed, prune=False)
+        rng = np.random.default_rng(seed)
+        x = self.index[X]
+        possible_values = self.nodes[x].get_values()
+        if X in e.keys():
+            return {v: (1.0 if v == e[X] else 0.0) for v in possible_values}, float("inf")
+        if samples is not None and samples < 1:
+            raise Exception("likelihood_weighting_ask needs at least one sample")
+        tables = [n.cdt.tabulate().table for n in self.nodes]
+        columns = self.parent_columns
+        evidence = [n.get_values().index(e[n.name]) if n.name in e.keys() else None for n in self.nodes]
+        counts = np.zeros(len(possible_values))
+        weight_sum = 0.0
+        square_sum = 0.0
+        budget = Sample_Budget(samples, seconds)
+        # A budget already spent (by the clock) still gets one batch
+        size = budget.batch(batch_size) or batch_size
+        while size:
+            indices = np.empty((size, len(self.nodes)), dtype=np.intp)
+            weights = np.ones(size)
+            for i in range(len(self.nodes)):
+                rows = cdt_rows(tables[i], indices, columns[i])
+                if evidence[i] is None:
+                    indices[:, i] = sample_categorical(rng, rows)
+                else:
+                    indices[:, i] = evidence[i]
+                    weights *= rows[:, evidence[i]]
+            counts += np.bincount(indices[:, x], weights=weights, minlength=len(possible_values))
+            weight_sum += weights.sum()
+            square_sum += (weights**2).sum()
+            budget.drawn += size
+            size = budget.batch(batch_size)
+        if weight_sum == 0:
+            raise Exception("Every sample gave the evidence probability zero")
+        dist = {v: float(counts[i]/weight_sum) for i, v in enumerate(possible_values)}
+        ess = float(weight_sum**2/square_sum) if square_sum > 0 else 0.0
+        return dist, ess
+
+    def gibbs_ask(
+        self,
+        X : str,
+        e : Dict[str, Any],
+        samples : int = None,
+        seconds : float = None,
+        chains : int = 1000,
+        burn_in : int = 100,
+        seed = None,
+        prune : bool = True,
+    ) -> Tuple[Dict[Any, float], float]:
+        """
+        Approximate posterior for X given e by Gibbs sampling. The given
+        number of chains run in lockstep: each sweep resamples every hidden
+        variable, in topological order, from its distribution given its
+        Markov blanket, for all chains at once. After burn_in sweeps every
+        chain contributes one sample per sweep until samples are counted or
+        seconds (not counting burn-in) run out; the last sweep counts only
+        as many chains as the sample budget has left, and at least one
+        sweep is always counted. Returns the posterior and an effective
+        sample size estimated from the spread of the per-chain averages.
+        Chains can get stuck when some probabilities are zero.
+        """
+        if prune and X not in e.keys():
+            bn, e = self.prune(X, e)
+            return bn.gibbs_ask(X, e, samples, seconds, chains, burn_in, seed, prune=False)
+        rng = np.random.default_rng(seed)
+        x = self.index[X]
+        possible_values = self.nodes[x].get_values()
+        if X in e.keys():
+            return {v: (1.0 if v == e[X] else 0.0) for v in possible_values}, float("inf")
+        if samples is not None and samples < 1:
+            raise Exception("gibbs_ask needs at least one sample")
+        tables = [n.cdt.tabulate().table for n in self.nodes]
+        columns = self.parent_columns
+        children = [[] for n in self.nodes]
+        for i in range(len(self.nodes)):
+            for p in self.parent_columns[i]:
+                children[p].append(i)
+        mask = self.evidence_mask(e)
+        hidden = [i for i in range(len(self.nodes)) if not mask[i]]
+        # Start every chain from a forward sample with the evidence clamped
+        indices = np.empty((chains, len(self.nodes)), dtype=np.intp)
+        for i, n in enumerate(self.nodes):
+            if mask[i]:
+                indices[:, i] = n.get_values().index(e[n.name])
+            else:
+                indices[:, i] = sample_categorical(rng, cdt_rows(tables[i], indices, columns[i]))
+        def sweep():
+            for i in hidden:
+                arity = tables[i].shape[-1]
+                weights = cdt_rows(tables[i], indices, columns[i])
+                for j in children[i]:
+                    # Look up the child's probability under every value of i
+                    index = [indices[:, c][:, None] for c in columns[j]] + [indices[:, j][:, None]]
+                    index[columns[j].index(i)] = np.arange(arity)[None, :]
+                    weights = weights*tables[j][tuple(index)]
+                indices[:, i] = sample_categorical(rng, weights)
+        for s in range(burn_in):
+            sweep()
+        budget = Sample_Budget(samples, seconds)
+        per_chain = np.zeros((chains, len(possible_values)))
+        # A budget already spent (by the clock) still gets one full sweep
+        size = budget.batch(chains) or chains
+        while size:
+            sweep()
+            per_chain[np.arange(size), indices[:size, x]] += 1
+            budget.drawn += size
+            size = budget.batch(chains)
+        total = per_chain.sum()
+        counts = per_chain.sum(axis=0)
+        dist = {v: float(counts[i]/total) for i, v in enumerate(possible_values)}
+        # Between-chain variance of each value's frequency against the
+        # variance a single independent draw would have
+        ess = float(total)
+        drawn = per_chain.sum(axis=1)
+        active = drawn > 0
+        if active.sum() > 1:
+            means = per_chain[active]/drawn[active][:, None]
+            for i in range(len(possible_values)):
+                p = counts[i]/total
+                between = means[:, i].var(ddof=1)
+                if 0 < p < 1 and between > 0:
+                    ess = min(ess, float(active.sum()*p*(1-p)/between))
+        return dist, ess
+
     def enumerate_all(self, vars : List[Variable_Node], e):
         """Sum over all assignments to vars, fixing those in e."""
-        if not vars:
-            return 1.0
-        y = vars[0]
-        if y.name in e.keys():
-            return y.get_fully_conditioned_dist()[y.value]*self.enumerate_all(vars[1:], e)
-        else:
-            total = 0
-            for val in y.get_values():
-                y.value = val
-                total += y.get_fully_conditioned_dist()[y.value]*self.enumerate_all(vars[1:], e)
-            return total
+        ids = [self.index[v.name] for v in vars]
+        return self.enumerate_ids(ids, 0, self.evidence_mask(e), self.assignment_list(e))
+
+    def log_enumerate_all(self, vars : List[Variable_Node], e):
+        """The log of enumerate_all(vars, e), summed with log_add."""
+        ids = [self.index[v.name] for v in vars]
+        return self.log_enumerate_ids(ids, 0, self.evidence_mask(e), self.assignment_list(e))
+
+    def enumerate_ids(self, ids : List[int], k : int, mask : List[bool], assignment : List[Any]):
+        """
+        Sum over all assignments to the nodes ids[k:] that mask leaves
+        free. The values chosen so far are written into assignment, which
+        belongs to the calling query.
+        """
+        return self.sum_suffixes(ids, k, mask, assignment, False)
+
+    def log_enumerate_ids(self, ids : List[int], k : int, mask : List[bool], assignment : List[Any]):
+        """The log of enumerate_ids."""
+        return self.sum_suffixes(ids, k, mask, assignment, True)
+
+    def sum_suffixes(
+        self,
+        ids : List[int],
+        k : int,
+        mask : List[bool],
+        assignment : List[Any],
+        log_space : bool,
+        contexts : List[List[int]] = None,
+        cache : Dict[Tuple, float] = None,
+    ):
+        """
+        The sum behind enumerate_ids, walked with an explicit stack so that
+        nets of any depth fit. Each frame holds the position it sums over,
+        its cache key, the values left to try and the total so far. With a
+        cache, the sum from node ids[k] onwards is stored under ids[k] and
+        the values of contexts[ids[k]] (see suffix_contexts), unless that
+        context is None.
+        """
+        nodes = self.nodes
+        end = len(ids)
+        prob = self.conditioned_log_prob if log_space else self.conditioned_prob
+        stack = []
+        result = None
+        while True:
+            # Descend until a sum is known, either the empty one or a cached one
+            while result is None:
+                if k == end:
+                    result = 0.0 if log_space else 1.0
+                    break
+                i = ids[k]
+                key = None
+                if cache is not None and contexts[i] is not None:
+                    key = (i,) + tuple([assignment[j] for j in contexts[i]])
+                    result = cache.get(key)
+                    if result is not None:
+                        break
+                values = None
+                if not mask[i]:
+                    values = nodes[i].get_values()
+                    assignment[i] = values[0]
+                stack.append([k, key, values, 0, -math.inf if log_space else 0.0, prob(i, assignment)])
+                k += 1
+            # Fold it into the frames above, descending again at the first
+            # one with values left to try
+            while stack:
+                frame = stack[-1]
+                term = frame[5] + result if log_space else frame[5]*result
+                if frame[2] is None:
+                    frame[4] = term
+                elif log_space:
+                    frame[4] = log_add(frame[4], term)
+                else:
+                    frame[4] += term
+                frame[3] += 1
+                if frame[2] is not None and frame[3] < len(frame[2]):
+                    i = ids[frame[0]]
+                    assignment[i] = frame[2][frame[3]]
+                    frame[5] = prob(i, assignment)
+                    k = frame[0] + 1
+                    result = None
+                    break
+                stack.pop()
+                if frame[1] is not None:
+                    cache[frame[1]] = frame[4]
+                result = frame[4]
+            if result is not None:
+                return result
+
+    def suffix_contexts(self, mask : List[bool], x : int = None) -> List[List[int]]:
+        """
+        For each node id i, the ids whose values the sum over nodes i
+        onwards depends on: the nodes from i on that mask fixes, and the
+        earlier nodes that some node from i on conditions on.
+        The sum is reached once for each assignment to the earlier nodes
+        that take several values, those mask leaves free and x (the query
+        node, which mask fixes). If its context holds all of them, no two
+        visits share a key, and its context is None instead.
+        """
+        contexts = [[] for n in self.nodes]
+        needed = set()
+        for i in reversed(range(len(self.nodes))):
+            needed.update(self.parent_columns[i])
+            if mask[i]:
+                needed.add(i)
+            elif i in needed:
+                needed.remove(i)
+            contexts[i] = sorted(needed)
+        varying = 0
+        for i in range(len(self.nodes)):
+            if varying == len([j for j in contexts[i] if j < i and (j == x or not mask[j])]):
+                contexts[i] = None
+            if i == x or not mask[i]:
+                varying += 1
+        return contexts
+
+    def enumerate_all_cached(self, e, log_space : bool = False):
+        """
+        Same sum as enumerate_all(self.nodes, e), with each suffix sum
+        cached on the values of its context (see suffix_contexts), so
+        branches that agree on everything a suffix depends on share one
+        computation. With log_space, returns the log of the sum instead.
+        """
+        mask = self.evidence_mask(e)
+        return self.enumerate_cached(mask, self.assignment_list(e), log_space, self.suffix_contexts(mask), dict())
 
+    def enumerate_cached(
+        self,
+        mask : List[bool],
+        assignment : List[Any],
+        log_space : bool,
+        contexts : List[List[int]],
+        cache : Dict[Tuple, float],
+    ):
+        """enumerate_all_cached for a mask whose contexts are already known.
+        The cache belongs to the caller and is only valid for this mask."""
+        return self.sum_suffixes(list(range(len(self.nodes))), 0, mask, assignment, log_space, contexts, cache)
+
+
+# State of an ask_many worker process, set once by init_ask_worker
+worker_net = None
+worker_method = None
+
+def init_ask_worker(source, method: str):
+    """source is either the output of spec() or the path of a saved net."""
+    global worker_net, worker_method
+    if isinstance(source, str):
+        worker_net = Bayes_Net.load(source)
+    else:
+        worker_net = Bayes_Net.from_spec(source)
+    worker_method = getattr(worker_net, method)
+
+def ask_worker(query: Tuple[str, Dict[str, Any]]) -> Dict[Any, float]:
+    X, e = query
+    return worker_method(X, e)
 
 def main():
     coinFlip = Variable_Node(
@@ -293,6 +1332,26 @@ def main():
     print(
         "Probability of cheating given result called is H and H: %.3f" % (bn.enumeration_ask("cheatingDeclared", {"resultCalled":"H", "coinFlip":"H"})["Y"]),
     )
+    print(
+        "Same query with memoized enumeration: %.3f" % (bn.enumeration_ask("cheatingDeclared", {"resultCalled":"H", "coinFlip":"H"}, memoize=True)["Y"]),
+    )
+    print(
+        "Same query with log-space enumeration: %.3f" % (bn.enumeration_ask("cheatingDeclared", {"resultCalled":"H", "coinFlip":"H"}, log_space=True)["Y"]),
+    )
+    print(
+        "Same query by variable elimination: %.3f" % (bn.variable_elimination_ask("cheatingDeclared", {"resultCalled":"H", "coinFlip":"H"})["Y"]),
+    )
+    bn.tabulate()
+    print(
+        "Same query with tabulated CDTs: %.3f" % (bn.enumeration_ask("cheatingDeclared", {"resultCalled":"H", "coinFlip":"H"})["Y"]),
+    )
+    print(
+        "Batched probabilities of H,H,Y and T,H,N: %s" % (bn.P_batch([[0, 0, 0], [1, 0, 1]])),
+    )
+    dist, ess = bn.likelihood_weighting_ask("coinFlip", {"resultCalled":"T", "cheatingDeclared":"Y"})
+    print("Likelihood weighting estimate of H given result called is T and cheating is Y: %.3f (effective samples %.0f)" % (dist["H"], ess))
+    dist, ess = bn.gibbs_ask("coinFlip", {"resultCalled":"T", "cheatingDeclared":"Y"})
+    print("Gibbs sampling estimate of H given result called is T and cheating is Y: %.3f (effective samples %.0f)" % (dist["H"], ess))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,249 @@
+from typing import List, Dict, Any, Callable
+import json
+import multiprocessing
+import platform
+import random
+import time
+import tracemalloc
+import numpy as np
+
+from bayes_net import Bayes_Net, Variable_Node, Tabular_CDT
+from junction_tree import Junction_Tree
+
+def random_table(rng : np.random.Generator, parents : List[Variable_Node], arity : int) -> np.ndarray:
+    """A CDT table whose rows are drawn uniformly from the simplex."""
+    shape = [len(p.get_values()) for p in parents] + [arity]
+    return rng.dirichlet(np.ones(arity), size=shape[:-1])
+
+def build_net(parent_ids : List[List[int]], arity : int, rng : np.random.Generator) -> Bayes_Net:
+    """A net whose node i has parents parent_ids[i] (all smaller than i),
+    with random tabulated CDTs over arity values each."""
+    nodes = []
+    values = ["x%d" % v for v in range(arity)]
+    for i, ids in enumerate(parent_ids):
+        parents = [nodes[j] for j in ids]
+        nodes.append(Variable_Node(Tabular_CDT(parents, random_table(rng, parents, arity), values), name="N%d" % i))
+    return Bayes_Net(nodes, ordered=True)
+
+def random_dag(n : int, max_parents : int = 2, arity : int = 2, seed = None) -> Bayes_Net:
+    """A net on n nodes where each node picks up to max_parents parents
+    among the nodes before it, with random tabulated CDTs."""
+    rng = np.random.default_rng(seed)
+    parent_ids = []
+    for i in range(n):
+        k = min(i, int(rng.integers(0, max_parents+1)))
+        parent_ids.append(sorted([int(j) for j in rng.choice(i, k, replace=False)]) if k else [])
+    return build_net(parent_ids, arity, rng)
+
+def chain(n : int, arity : int = 2, seed = None) -> Bayes_Net:
+    """N0 -> N1 -> ... -> N(n-1)."""
+    rng = np.random.default_rng(seed)
+    return build_net([[]] + [[i-1] for i in range(1, n)], arity, rng)
+
+def polytree(n : int, max_parents : int = 2, arity : int = 2, seed = None) -> Bayes_Net:
+    """A net with no undirected cycles: each node takes its parents from
+    distinct connected components of the nodes before it."""
+    rng = np.random.default_rng(seed)
+    component = list(range(n))
+    def find(i):
+        while component[i] != i:
+            component[i] = component[component[i]]
+            i = component[i]
+        return i
+    parent_ids = []
+    for i in range(n):
+        ids = []
+        roots = set()
+        for j in rng.permutation(i):
+            if len(ids) == max_parents:
+                break
+            if find(int(j)) not in roots and rng.random() < 0.5:
+                roots.add(find(int(j)))
+                ids.append(int(j))
+        for j in ids:
+            component[find(j)] = i
+        parent_ids.append(sorted(ids))
+    return build_net(parent_ids, arity, rng)
+
+def grid(rows : int, cols : int, arity : int = 2, seed = None) -> Bayes_Net:
+    """A rows x cols lattice where each cell depends on the cells above
+    and to its left. Node r*cols + c is the cell in row r, column c."""
+    rng = np.random.default_rng(seed)
+    parent_ids = []
+    for r in range(rows):
+        for c in range(cols):
+            ids = []
+            if r > 0:
+                ids.append((r-1)*cols + c)
+            if c > 0:
+                ids.append(r*cols + c-1)
+            parent_ids.append(sorted(ids))
+    return build_net(parent_ids, arity, rng)
+
+def random_queries(bn : Bayes_Net, count : int, evidence : int = 2, seed = None) -> List:
+    """count (X, e) pairs with evidence random assignments each."""
+    rng = random.Random(seed)
+    names = [n.name for n in bn.nodes]
+    queries = []
+    for q in range(count):
+        chosen = rng.sample(range(len(names)), min(len(names), evidence+1))
+        e = {names[i]: rng.choice(bn.nodes[i].get_values()) for i in chosen[1:]}
+        queries.append((names[chosen[0]], e))
+    return queries
+
+def random_assignments(bn : Bayes_Net, count : int, seed = None) -> List[List[Any]]:
+    """count full assignments of values, in node id order, as P takes them."""
+    rng = random.Random(seed)
+    return [[rng.choice(n.get_values()) for n in bn.nodes] for i in range(count)]
+
+def random_indices(bn : Bayes_Net, count : int, seed = None) -> np.ndarray:
+    """count full assignments of value ordinals, as P_batch takes them."""
+    rng = np.random.default_rng(seed)
+    return np.stack([rng.integers(0, len(n.get_values()), count) for n in bn.nodes], axis=1)
+
+class Engine:
+    """
+    One way of answering queries. setup(bn) runs once per net and its
+    result is passed to run(state, X, e, values) for each case, where
+    values is a full assignment for the joint probability engines. Nets
+    with more than max_nodes nodes are skipped.
+    """
+    def __init__(self, name : str, run : Callable, setup : Callable = None, max_nodes : int = None):
+        self.name = name
+        self.run = run
+        self.setup = setup if setup is not None else (lambda bn: bn)
+        self.max_nodes = max_nodes
+
+# The batch engines score the same batch_rows assignments on every case
+batch_rows = 1000
+
+engines = [
+    Engine("P", lambda bn, X, e, values: bn.P(values)),
+    Engine("log_P", lambda bn, X, e, values: bn.log_P(values)),
+    Engine("P_batch", lambda state, X, e, values: state[0].P_batch(state[1]), setup=lambda bn: (bn, random_indices(bn, batch_rows, seed=0))),
+    Engine("log_P_batch", lambda state, X, e, values: state[0].log_P_batch(state[1]), setup=lambda bn: (bn, random_indices(bn, batch_rows, seed=0))),
+    Engine("enumeration_ask", lambda bn, X, e, values: bn.enumeration_ask(X, e, prune=False), max_nodes=16),
+    Engine("enumeration_ask_memoized", lambda bn, X, e, values: bn.enumeration_ask(X, e, memoize=True, prune=False), max_nodes=30),
+    Engine("enumeration_ask_memoized_pruned", lambda bn, X, e, values: bn.enumeration_ask(X, e, memoize=True)),
+    Engine("variable_elimination_ask", lambda bn, X, e, values: bn.variable_elimination_ask(X, e, prune=False)),
+    Engine("variable_elimination_ask_pruned", lambda bn, X, e, values: bn.variable_elimination_ask(X, e)),
+    Engine("junction_tree", lambda jt, X, e, values: jt.ask(X, e), setup=Junction_Tree),
+    Engine("likelihood_weighting_ask", lambda bn, X, e, values: bn.likelihood_weighting_ask(X, e, samples=10000, seed=0)),
+    Engine("gibbs_ask", lambda bn, X, e, values: bn.gibbs_ask(X, e, samples=10000, chains=100, burn_in=10, seed=0)),
+]
+
+def count_edges(bn : Bayes_Net) -> int:
+    return sum([len(c) for c in bn.parent_columns])
+
+def clear_caches(bn : Bayes_Net):
+    """Forget the pruned nets kept by bn, so no engine starts warm."""
+    with bn.pruned_lock:
+        bn.pruned.clear()
+
+def time_engine(engine : Engine, bn : Bayes_Net, queries : List, assignments : List[List[Any]]) -> Dict[str, Any]:
+    """
+    Latency of each case in seconds, summarized as percentiles, plus the
+    peak traced memory of one further pass over the first case (measured
+    separately because tracing slows everything down). Both start from
+    cold caches and a fresh setup.
+    """
+    clear_caches(bn)
+    start = time.perf_counter()
+    state = engine.setup(bn)
+    setup_seconds = time.perf_counter() - start
+    latencies = []
+    for (X, e), values in zip(queries, assignments):
+        start = time.perf_counter()
+        engine.run(state, X, e, values)
+        latencies.append(time.perf_counter() - start)
+    X, e = queries[0]
+    clear_caches(bn)
+    state = engine.setup(bn)
+    tracemalloc.start()
+    engine.run(state, X, e, assignments[0])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "setup_seconds": setup_seconds,
+        "cases": len(latencies),
+        "mean": float(np.mean(latencies)),
+        "p50": float(np.percentile(latencies, 50)),
+        "p90": float(np.percentile(latencies, 90)),
+        "p99": float(np.percentile(latencies, 99)),
+        "max": float(np.max(latencies)),
+        "peak_memory_bytes": peak,
+    }
+
+def run_suite(workloads : Dict[str, Bayes_Net], cases : int = 20, engines : List[Engine] = engines, seed = 0) -> List[Dict[str, Any]]:
+    """Time every engine on every named net. Returns one record per pair."""
+    results = []
+    for name, bn in workloads.items():
+        queries = random_queries(bn, cases, seed=seed)
+        assignments = random_assignments(bn, cases, seed=seed)
+        for engine in engines:
+            record = {
+                "workload": name,
+                "nodes": len(bn.nodes),
+                "edges": count_edges(bn),
+                "max_in_degree": max([len(c) for c in bn.parent_columns]),
+                "engine": engine.name,
+            }
+            if engine.max_nodes is not None and len(bn.nodes) > engine.max_nodes:
+                record["skipped"] = True
+            else:
+                record.update(time_engine(engine, bn, queries, assignments))
+            results.append(record)
+    return results
+
+def write_results(results : List[Dict[str, Any]], path : str):
+    """Save results as JSON with enough context to compare runs."""
+    report = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "cpus": multiprocessing.cpu_count(),
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(report, f, indent=1)
+
+def ask_many_scaling(bn : Bayes_Net, queries : List, worker_counts : List[int] = None, method : str = "variable_elimination_ask") -> Dict[int, float]:
+    """Seconds taken by bn.ask_many over queries for each worker count."""
+    if worker_counts is None:
+        worker_counts = [2**i for i in range(multiprocessing.cpu_count().bit_length())]
+    timings = dict()
+    for w in worker_counts:
+        start = time.perf_counter()
+        bn.ask_many(queries, workers=w, method=method)
+        timings[w] = time.perf_counter() - start
+    return timings
+
+def main(output : str = "benchmark_results.json"):
+    workloads = {
+        "random_dag_12": random_dag(12, max_parents=2, arity=2, seed=0),
+        "random_dag_24": random_dag(24, max_parents=2, arity=2, seed=0),
+        "chain_30": chain(30, arity=3, seed=0),
+        "grid_4x5": grid(4, 5, arity=2, seed=0),
+        "random_dag_40": random_dag(40, max_parents=3, arity=3, seed=0),
+        "chain_100": chain(100, arity=3, seed=0),
+        "polytree_60": polytree(60, max_parents=3, arity=2, seed=0),
+        "grid_6x6": grid(6, 6, arity=2, seed=0),
+    }
+    results = run_suite(workloads)
+    for r in results:
+        if r.get("skipped"):
+            print("%-14s %-32s skipped" % (r["workload"], r["engine"]))
+        else:
+            print("%-14s %-32s p50 %9.6fs p99 %9.6fs peak %8d bytes" % (r["workload"], r["engine"], r["p50"], r["p99"], r["peak_memory_bytes"]))
+    write_results(results, output)
+    print("Wrote %s" % output)
+
+    bn = workloads["random_dag_40"]
+    timings = ask_many_scaling(bn, random_queries(bn, 2000, seed=0))
+    base = timings[min(timings.keys())]
+    for w, t in timings.items():
+        print("%2d workers: %.2fs (speedup %.2f)" % (w, t, base/t))
+
+if __name__ == "__main__":
+    main()
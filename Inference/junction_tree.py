@@ -0,0 +1,264 @@
+from typing import List, Dict, Tuple, Any
+import threading
+import numpy as np
+
+from bayes_net import (
+    Bayes_Net,
+    Variable_Node,
+    Factor,
+    EliminationHeuristic,
+    greedy_elimination,
+    node_factor,
+    min_fill,
+    min_degree,
+)
+
+def triangulate(bn : Bayes_Net, heuristic : EliminationHeuristic = min_fill) -> List[List[Variable_Node]]:
+    """
+    Eliminate every variable of the moral graph of bn in heuristic order
+    and return the maximal clusters formed along the way. These are the
+    cliques of a triangulation of the moral graph.
+    """
+    if heuristic is min_fill or heuristic is min_degree:
+        clusters = eliminate_graph(bn, heuristic)
+    else:
+        clusters = eliminate_scopes(bn, heuristic)
+    # A cluster can only be contained in one formed before it that holds
+    # its eliminated variable, since later ones never mention it
+    containing = dict()
+    cliques = []
+    for c in clusters:
+        members = set(c)
+        if not any(members < d for d in containing.get(c[0], ())):
+            cliques.append(c)
+        for v in c:
+            containing.setdefault(v, []).append(members)
+    return cliques
+
+def eliminate_scopes(bn : Bayes_Net, heuristic : EliminationHeuristic) -> List[List[Variable_Node]]:
+    """The cluster formed by each elimination, for any heuristic. Every step
+    hands the heuristic all remaining scopes, so this is quadratic."""
+    # Only the scopes matter here, so the factors carry no tables
+    scopes = [Factor(n.parents + [n], None) for n in bn.nodes]
+    remaining = list(bn.nodes)
+    clusters = []
+    while remaining:
+        var = heuristic(scopes, remaining)
+        remaining.remove(var)
+        touching = [f for f in scopes if var in f.vars]
+        cluster = [var]
+        for f in touching:
+            cluster.extend([v for v in f.vars if v not in cluster])
+        clusters.append(cluster)
+        scopes = [f for f in scopes if var not in f.vars]
+        scopes.append(Factor([v for v in cluster if v is not var], None))
+    return clusters
+
+def eliminate_graph(bn : Bayes_Net, heuristic : EliminationHeuristic) -> List[List[Variable_Node]]:
+    """
+    Same clusters as eliminate_scopes for min_fill and min_degree, found by
+    greedy_elimination on the moral graph. Ties still go to the earliest
+    node.
+    """
+    position = {n: i for i, n in enumerate(bn.nodes)}
+    graph = {n: set() for n in bn.nodes}
+    for n in bn.nodes:
+        family = n.parents + [n]
+        for v in family:
+            graph[v].update(family)
+    for n in bn.nodes:
+        graph[n].discard(n)
+    return [[var] + sorted(neighbors, key=position.get) for var, neighbors in greedy_elimination(graph, bn.nodes, heuristic)]
+
+def spanning_tree(cliques : List[List[Variable_Node]]) -> List[Tuple[int, int]]:
+    """
+    Maximum weight spanning tree over cliques, weighted by separator size
+    (Kruskal's algorithm over the pairs that share a variable). Disconnected
+    parts are joined by empty separators, so the result is always a single
+    tree.
+    """
+    containing = dict()
+    for i, c in enumerate(cliques):
+        for v in c:
+            containing.setdefault(v, []).append(i)
+    sets = [set(c) for c in cliques]
+    pairs = set()
+    for members in containing.values():
+        for a, i in enumerate(members):
+            for j in members[a+1:]:
+                pairs.add((i, j))
+    weighted = sorted([(-len(sets[i] & sets[j]), i, j) for i, j in pairs])
+    component = list(range(len(cliques)))
+    def find(i):
+        while component[i] != i:
+            component[i] = component[component[i]]
+            i = component[i]
+        return i
+    edges = []
+    for w, i, j in weighted + [(0, 0, j) for j in range(1, len(cliques))]:
+        a, b = find(i), find(j)
+        if a != b:
+            component[b] = a
+            edges.append((i, j))
+    return edges
+
+def normalized(f : Factor) -> Factor:
+    """f scaled to sum to one. A table of zeros, from evidence with
+    probability zero, is left as it is."""
+    mag = f.table.sum()
+    return Factor(f.vars, f.table/mag) if mag > 0 else f
+
+class Junction_Tree:
+    """
+    A clique tree compiled once from a Bayes_Net. Each call to
+    posterior_marginals does one collect and distribute sweep of
+    Shafer-Shenoy messages and returns the marginal of every variable.
+
+    Messages, and the products they are built from, are rescaled to sum to
+    one as they are formed. Only their shape matters to the marginals, and
+    a clique with many observed neighbors would otherwise underflow.
+
+    A message depends only on the evidence homed in the cliques behind it,
+    so messages are cached along with that evidence, as (node id, value)
+    pairs, and reused by later queries whose evidence agrees on that side
+    of the tree. The cache is shared, so queries from different threads
+    take turns.
+    """
+    def __init__(self, bn : Bayes_Net, heuristic : EliminationHeuristic = min_fill):
+        self.bn = bn
+        self.cliques = triangulate(bn, heuristic)
+        self.neighbors = [[] for c in self.cliques]
+        for i, j in spanning_tree(self.cliques):
+            self.neighbors[i].append(j)
+            self.neighbors[j].append(i)
+        # Each variable is homed in one clique containing it, where its
+        # evidence indicator is applied and its marginal is read off.
+        self.home = dict()
+        self.cliques_of = dict()
+        for i, c in enumerate(self.cliques):
+            for v in c:
+                self.home.setdefault(v, i)
+                self.cliques_of.setdefault(v, []).append(i)
+        self.homed = [[v for v in c if self.home[v] == i] for i, c in enumerate(self.cliques)]
+        self.potentials = [Factor(c, np.ones([len(v.get_values()) for v in c])) for c in self.cliques]
+        sets = [set(c) for c in self.cliques]
+        # A family lies in some clique holding its child, so only those are tried
+        for n in bn.nodes:
+            family = set(n.parents + [n])
+            for i in self.cliques_of[n]:
+                if family <= sets[i]:
+                    f = node_factor(n)
+                    self.potentials[i] = Factor(self.cliques[i], self.potentials[i].table*f.expand(self.cliques[i]))
+                    break
+        self.schedule = self.make_schedule()
+        # Home clique by node id. With the preorder positions kept by
+        # make_schedule, the cliques behind an edge are one range of
+        # positions (or its complement), so a message's evidence is found
+        # without listing everything behind it.
+        self.home_of = [self.home[n] for n in bn.nodes]
+        self.ids = {n.name: k for k, n in enumerate(bn.nodes)}
+        self.messages = dict()
+        self.lock = threading.Lock()
+
+    def make_schedule(self) -> List[Tuple[int, int]]:
+        """Directed edges in an order where every message is computed after
+        the messages it depends on: leaves to root, then root to leaves.
+        Also records each clique's parent, preorder position and subtree size."""
+        order = []
+        self.parent = [None for c in self.cliques]
+        seen = [False for c in self.cliques]
+        stack = [0] if self.cliques else []
+        while stack:
+            i = stack.pop()
+            seen[i] = True
+            order.append(i)
+            for j in self.neighbors[i]:
+                if not seen[j]:
+                    self.parent[j] = i
+                    stack.append(j)
+        self.tin = [0 for c in self.cliques]
+        self.size = [1 for c in self.cliques]
+        for t, i in enumerate(order):
+            self.tin[i] = t
+        for i in reversed(order):
+            if self.parent[i] is not None:
+                self.size[self.parent[i]] += self.size[i]
+        collect = [(i, self.parent[i]) for i in reversed(order) if self.parent[i] is not None]
+        distribute = [(j, i) for i, j in reversed(collect)]
+        return collect + distribute
+
+    def signature(self, i : int, j : int, evidence : List[Tuple[int, int, Any]]) -> Tuple:
+        """The (id, value) pairs of evidence homed on i's side of edge (i, j).
+        evidence holds (preorder position of home, id, value) triples."""
+        if self.parent[i] == j:
+            low, high, inside = self.tin[i], self.tin[i] + self.size[i], True
+        else:
+            low, high, inside = self.tin[j], self.tin[j] + self.size[j], False
+        return tuple([(k, value) for t, k, value in evidence if (low <= t < high) == inside])
+
+    def potential(self, i : int, e : Dict[str, Any]) -> Factor:
+        """The clique potential with indicators for evidence homed at i."""
+        f = self.potentials[i]
+        table = f.table
+        for v in self.homed[i]:
+            if v.name in e.keys():
+                indicator = np.zeros(len(v.get_values()))
+                indicator[v.get_values().index(e[v.name])] = 1.0
+                table = table*Factor([v], indicator).expand(f.vars)
+        return Factor(f.vars, table)
+
+    def message(self, i : int, j : int, e : Dict[str, Any], evidence : List[Tuple[int, int, Any]]) -> Factor:
+        signature = self.signature(i, j, evidence)
+        cached = self.messages.get((i, j))
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+        f = self.potential(i, e)
+        for k in self.neighbors[i]:
+            if k != j:
+                f = normalized(f.multiply(self.messages[(k, i)][1]))
+        for v in self.cliques[i]:
+            if v not in self.cliques[j]:
+                f = f.sum_out(v)
+        f = normalized(f)
+        self.messages[(i, j)] = (signature, f)
+        return f
+
+    def posterior_marginals(self, e : Dict[str, Any]) -> Dict[str, Dict[Any, float]]:
+        """Posterior distribution of every variable given the assignments in e."""
+        with self.lock:
+            self.sweep(e)
+            return {v.name: self.marginal(v, e) for v in self.bn.nodes}
+
+    def sweep(self, e : Dict[str, Any]):
+        """Bring every message up to date with e."""
+        index = self.ids
+        evidence = sorted([(self.tin[self.home_of[index[name]]], index[name], value) for name, value in e.items()])
+        for i, j in self.schedule:
+            self.message(i, j, e, evidence)
+
+    def marginal(self, v : Variable_Node, e : Dict[str, Any]) -> Dict[Any, float]:
+        """v's posterior, read off its home clique once sweep(e) is done."""
+        i = self.home[v]
+        f = self.potential(i, e)
+        for k in self.neighbors[i]:
+            f = normalized(f.multiply(self.messages[(k, i)][1]))
+        for u in self.cliques[i]:
+            if u is not v:
+                f = f.sum_out(u)
+        table = f.table
+        mag = table.sum()
+        return {x: table[k]/mag for k, x in enumerate(v.get_values())}
+
+    def ask(self, X : str, e : Dict[str, Any], prune : bool = True) -> Dict[Any, float]:
+        """
+        Same result as Bayes_Net.enumeration_ask. The tree is compiled for
+        the whole net, so pruning here only drops the evidence that
+        bayes_ball finds cannot change X. Fewer messages then depend on
+        evidence, and more are reused from earlier queries.
+        """
+        if prune and X not in e.keys():
+            observations = self.bn.bayes_ball(X, e)[1]
+            e = {n.name: e[n.name] for n in observations}
+        with self.lock:
+            self.sweep(e)
+            return self.marginal(self.bn.nodes[self.ids[X]], e)
@@ -0,0 +1,285 @@
+import random
+import concurrent.futures
+import numpy as np
+import pytest
+
+from bayes_net import (
+    Bayes_Net,
+    Variable_Node,
+    Discrete_CDT,
+    Tabular_CDT,
+    TOPSORT,
+    min_fill,
+    min_degree,
+    node_factor,
+    interaction_graph,
+    greedy_elimination,
+    eliminate,
+)
+from junction_tree import Junction_Tree
+from benchmark import build_net, random_dag, chain, grid, random_queries, random_indices
+
+def close(d, reference, tolerance = 1e-9):
+    return d.keys() == reference.keys() and all([abs(d[v] - reference[v]) < tolerance for v in reference])
+
+nets = [
+    random_dag(10, max_parents=2, arity=2, seed=0),
+    random_dag(12, max_parents=3, arity=3, seed=1),
+    chain(12, seed=2),
+    grid(3, 4, arity=2, seed=3),
+]
+
+def test_batch_scoring_matches_P():
+    bn = random_dag(10, max_parents=3, arity=3, seed=0)
+    indices = random_indices(bn, 50, seed=0)
+    p = bn.P_batch(indices)
+    for row, q in zip(indices, p):
+        assert abs(bn.P([n.get_values()[i] for n, i in zip(bn.nodes, row)]) - q) < 1e-12
+    assert np.allclose(bn.log_P_batch(indices), np.log(p))
+    for row, logq in zip(indices[:10], np.log(p)):
+        assert abs(bn.log_P([n.get_values()[i] for n, i in zip(bn.nodes, row)]) - logq) < 1e-9
+
+def test_log_P_batch_does_not_underflow():
+    bn = build_net([[]]*1500, 2, np.random.default_rng(1))
+    indices = random_indices(bn, 5, seed=1)
+    assert not bn.P_batch(indices).any()
+    logp = bn.log_P_batch(indices)
+    expected = [sum([np.log(n.cdt.table[i]) for n, i in zip(bn.nodes, row)]) for row in indices]
+    assert np.allclose(logp, expected)
+
+@pytest.mark.parametrize("bn", nets)
+def test_exact_engines_agree_with_enumeration(bn):
+    jt = Junction_Tree(bn)
+    for X, e in random_queries(bn, 12, evidence=3, seed=4):
+        reference = bn.enumeration_ask(X, e, prune=False)
+        assert close(bn.enumeration_ask(X, e), reference)
+        assert close(bn.enumeration_ask(X, e, memoize=True, prune=False), reference)
+        assert close(bn.enumeration_ask(X, e, log_space=True, prune=False), reference)
+        assert close(bn.enumeration_ask(X, e, memoize=True, log_space=True), reference)
+        assert close(bn.variable_elimination_ask(X, e, prune=False), reference)
+        assert close(bn.variable_elimination_ask(X, e), reference)
+        assert close(bn.variable_elimination_ask(X, e, log_space=True), reference)
+        assert close(jt.ask(X, e, prune=False), reference)
+        assert close(jt.ask(X, e), reference)
+        assert close(jt.posterior_marginals(e)[X], reference)
+
+@pytest.mark.parametrize("heuristic", [min_fill, min_degree])
+def test_greedy_elimination_picks_what_the_heuristic_picks(heuristic):
+    for bn in nets:
+        factors = [node_factor(n) for n in bn.nodes]
+        hidden = bn.nodes[1:]
+        order = [var for var, neighbors in greedy_elimination(interaction_graph(factors), hidden, heuristic)]
+        expected = []
+        while hidden:
+            var = heuristic(factors, hidden)
+            hidden = [v for v in hidden if v is not var]
+            factors = eliminate(factors, var)
+            expected.append(var)
+        assert order == expected
+
+def test_junction_tree_survives_wide_evidence():
+    # Every observed child has likelihood at most 0.03, so unscaled
+    # messages into the root underflow long before the 300th child
+    rng = np.random.default_rng(5)
+    values = ["x0", "x1"]
+    root = Variable_Node(Tabular_CDT([], np.array([0.4, 0.6]), values), name="N0")
+    likelihoods = rng.uniform(0.01, 0.03, size=(300, 2))
+    children = [Variable_Node(Tabular_CDT([root], np.stack([l, 1-l], axis=1), values), name="N%d" % (i+1)) for i, l in enumerate(likelihoods)]
+    bn = Bayes_Net([root] + children)
+    e = {c.name: "x0" for c in children}
+    logp = np.log(root.cdt.table) + np.log(likelihoods).sum(axis=0)
+    p = np.exp(logp - logp.max())
+    reference = {v: p[k]/p.sum() for k, v in enumerate(values)}
+    jt = Junction_Tree(bn)
+    assert close(jt.ask("N0", e), reference)
+    assert close(jt.posterior_marginals(e)["N0"], reference)
+    assert close(bn.enumeration_ask("N0", e, log_space=True), reference)
+    assert close(bn.enumeration_ask("N0", e, memoize=True, log_space=True), reference)
+    assert close(bn.variable_elimination_ask("N0", e, log_space=True), reference)
+
+def test_memo_does_not_outlive_a_query():
+    bn = random_dag(8, seed=7)
+    X, e = random_queries(bn, 1, seed=7)[0]
+    bn.enumeration_ask(X, e, memoize=True)
+    rng = np.random.default_rng(7)
+    for n in bn.nodes:
+        n.cdt = Tabular_CDT(n.parents, rng.dirichlet(np.ones(2), size=n.cdt.table.shape[:-1]), n.get_values())
+    reference = bn.enumeration_ask(X, e, prune=False)
+    assert close(bn.enumeration_ask(X, e, memoize=True), reference)
+    assert close(bn.enumeration_ask(X, e), reference)
+    assert close(bn.variable_elimination_ask(X, e), reference)
+
+def test_memo_only_keys_suffixes_that_can_be_shared():
+    bn = chain(4, seed=3)
+    # N1's sum depends on N0, the only node before it that varies, so each
+    # visit has its own key; N2's depends on N1 but not on N0
+    contexts = bn.suffix_contexts([True, False, False, False], 0)
+    assert contexts[0] is None and contexts[1] is None
+    assert contexts[2] == [1] and contexts[3] == [2]
+
+def test_tables_follow_replaced_dists():
+    values = ["x0", "x1"]
+    root = Variable_Node(Discrete_CDT([], lambda r: {"x0": 0.3, "x1": 0.7}, values), name="N0")
+    child = Variable_Node(Discrete_CDT([root], lambda r: {"x0": 0.9, "x1": 0.1} if r[0] == "x0" else {"x0": 0.2, "x1": 0.8}, values), name="N1")
+    bn = Bayes_Net([root, child])
+    e = {"N1": "x0"}
+    bn.variable_elimination_ask("N0", e)
+    child.cdt.dists = lambda r: {"x0": 0.5, "x1": 0.5}
+    reference = bn.enumeration_ask("N0", e, prune=False)
+    assert close(reference, {"x0": 0.3, "x1": 0.7})
+    assert close(bn.variable_elimination_ask("N0", e), reference)
+    assert np.allclose(bn.P_batch([[0, 0], [1, 0]]), [0.15, 0.35])
+
+def test_queries_from_threads_agree():
+    bn = nets[0]
+    jt = Junction_Tree(bn)
+    queries = random_queries(bn, 20, evidence=3, seed=8)
+    asks = [lambda X, e: bn.enumeration_ask(X, e), lambda X, e: bn.enumeration_ask(X, e, memoize=True), jt.ask]
+    with concurrent.futures.ThreadPoolExecutor(4) as pool:
+        for ask in asks:
+            futures = [pool.submit(ask, X, e) for X, e in queries]
+            for (X, e), f in zip(queries, futures):
+                assert close(f.result(), bn.enumeration_ask(X, e))
+
+@pytest.mark.parametrize("bn", nets[:2])
+def test_samplers_approach_enumeration(bn):
+    for X, e in random_queries(bn, 3, evidence=2, seed=5):
+        reference = bn.enumeration_ask(X, e)
+        lw, ess = bn.likelihood_weighting_ask(X, e, samples=20000, seed=0)
+        assert close(lw, reference, 0.05)
+        gibbs, ess = bn.gibbs_ask(X, e, samples=20000, chains=200, seed=0)
+        assert close(gibbs, reference, 0.08)
+
+def test_samplers_always_sample():
+    bn = nets[0]
+    X, e = random_queries(bn, 1, seed=6)[0]
+    for ask in (bn.likelihood_weighting_ask, bn.gibbs_ask):
+        dist, ess = ask(X, e, seconds=0.0, seed=0)
+        assert abs(sum(dist.values()) - 1) < 1e-9 and ess > 0
+        dist, ess = ask(X, e, samples=5, seed=0)
+        assert abs(sum(dist.values()) - 1) < 1e-9
+        with pytest.raises(Exception):
+            ask(X, e, samples=0)
+
+def test_likelihood_weighting_rejects_impossible_evidence():
+    values = ["x0", "x1"]
+    root = Variable_Node(Tabular_CDT([], np.array([0.5, 0.5]), values), name="N0")
+    child = Variable_Node(Tabular_CDT([root], np.array([[1.0, 0.0], [1.0, 0.0]]), values), name="N1")
+    bn = Bayes_Net([root, child])
+    with pytest.raises(Exception):
+        bn.likelihood_weighting_ask("N0", {"N1": "x1"}, samples=100)
+
+def test_ask_many_matches_one_at_a_time():
+    for bn, method in [(nets[1], "variable_elimination_ask"), (nets[0], "enumeration_ask")]:
+        queries = random_queries(bn, 30, evidence=2, seed=9)
+        expected = [getattr(bn, method)(X, e) for X, e in queries]
+        for workers in (1, 2):
+            results = bn.ask_many(queries, workers=workers, method=method)
+            assert len(results) == len(queries)
+            assert all([close(d, reference) for d, reference in zip(results, expected)])
+
+def test_pruned_nets_are_reused():
+    bn = nets[1]
+    X, e = random_queries(bn, 1, evidence=3, seed=7)[0]
+    first, _ = bn.prune(X, e)
+    flipped = {name: [n for n in bn.nodes if n.name == name][0].get_values()[-1] for name in e}
+    second, kept = bn.prune(X, flipped)
+    assert first is second
+    assert kept.keys() <= flipped.keys() and len(second.nodes) <= len(bn.nodes)
+    assert close(bn.enumeration_ask(X, flipped), bn.enumeration_ask(X, flipped, prune=False))
+
+def test_topsort_is_quiet_and_finds_cycles(capsys):
+    bn = random_dag(30, max_parents=3, seed=10)
+    shuffled = list(bn.nodes)
+    random.Random(10).shuffle(shuffled)
+    lines = []
+    nodes = TOPSORT(shuffled, trace=lines.append)
+    assert lines and not capsys.readouterr().out
+    position = {n: i for i, n in enumerate(nodes)}
+    assert sorted(position.values()) == list(range(30))
+    assert all([position[p] < position[n] for n in nodes for p in n.parents])
+    child = [n for n in bn.nodes if n.parents][0]
+    child.children.append(child.parents[0])
+    with pytest.raises(Exception):
+        TOPSORT(bn.nodes)
+
+def test_duplicate_names_are_rejected():
+    values = ["x0", "x1"]
+    root = Variable_Node(Tabular_CDT([], np.array([0.5, 0.5]), values), name="N0")
+    child = Variable_Node(Tabular_CDT([root], np.array([[0.9, 0.1], [0.2, 0.8]]), values), name="N0")
+    with pytest.raises(Exception, match="Duplicate node name N0"):
+        Bayes_Net([root, child])
+
+def test_deep_chain_does_not_recurse():
+    bn = chain(1200, seed=6)
+    e = {n.name: n.get_values()[0] for n in bn.nodes if n.name != "N0"}
+    reference = bn.variable_elimination_ask("N0", e, log_space=True, prune=False)
+    assert close(bn.enumeration_ask("N0", e, memoize=True, log_space=True, prune=False), reference)
+    assert close(bn.enumeration_ask("N0", e, log_space=True, prune=False), reference)
+    assert close(Junction_Tree(bn).ask("N0", e, prune=False), reference)
+
+def forward_sample(bn, count, seed = None):
+    """count rows of value ordinals drawn from bn, columns in id order."""
+    rng = np.random.default_rng(seed)
+    data = np.zeros((count, len(bn.nodes)), dtype=np.intp)
+    for i, n in enumerate(bn.nodes):
+        rows = n.cdt.table[tuple([data[:, bn.index[p.name]] for p in n.parents])]
+        u = rng.random((count, 1))
+        data[:, i] = np.minimum((rows.cumsum(axis=-1) < u).sum(axis=-1), rows.shape[-1]-1)
+    return data
+
+def uniform_copy(bn):
+    """A net with bn's names and structure but uniform tables."""
+    copies = dict()
+    for n in bn.nodes:
+        shape = [len(p.get_values()) for p in n.parents] + [len(n.get_values())]
+        copies[n] = Variable_Node(Tabular_CDT([copies[p] for p in n.parents], np.ones(shape)/shape[-1], n.get_values()), name=n.name)
+    return Bayes_Net([copies[n] for n in bn.nodes])
+
+def test_fit_recovers_the_tables():
+    bn = nets[1]
+    fitted = uniform_copy(bn)
+    data = forward_sample(bn, 200000, seed=11)[:, [bn.index[n.name] for n in fitted.nodes]]
+    fitted.fit(np.array_split(data, 7))
+    # Rarely seen parent values leave some rows noisy, so compare the
+    # joints instead: the mean log ratio on fresh data estimates their KL
+    fresh = forward_sample(bn, 20000, seed=12)
+    kl = np.mean(bn.log_P_batch(fresh) - fitted.log_P_batch(fresh[:, [bn.index[n.name] for n in fitted.nodes]]))
+    assert abs(kl) < 0.01
+    counted = uniform_copy(bn).fit(data[:50], alpha=1.0)
+    for m in counted.nodes:
+        assert np.allclose(m.cdt.table.sum(axis=-1), 1) and (m.cdt.table > 0).all()
+    X, e = random_queries(bn, 1, seed=11)[0]
+    before = fitted.enumeration_ask(X, e)
+    fitted.fit(data[:50])
+    assert close(fitted.enumeration_ask(X, e), fitted.enumeration_ask(X, e, prune=False))
+    assert not close(fitted.enumeration_ask(X, e), before)
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_save_load_round_trip(tmp_path, mmap):
+    bn = nets[1]
+    path = str(tmp_path / "net.bin")
+    bn.save(path)
+    loaded = Bayes_Net.load(path, mmap=mmap)
+    assert [n.name for n in loaded.nodes] == [n.name for n in bn.nodes]
+    for n, m in zip(bn.nodes, loaded.nodes):
+        assert [p.name for p in m.parents] == [p.name for p in n.parents]
+        assert m.get_values() == n.get_values()
+        assert np.array_equal(m.cdt.table, n.cdt.table)
+        assert isinstance(m.cdt.table.base, np.memmap) == mmap
+    indices = random_indices(bn, 20, seed=13)
+    assert np.array_equal(loaded.P_batch(indices), bn.P_batch(indices))
+    for X, e in random_queries(bn, 3, seed=13):
+        assert close(loaded.enumeration_ask(X, e), bn.enumeration_ask(X, e))
+    with open(path, "r+b") as f:
+        f.write(b"NOTANET")
+    with pytest.raises(Exception):
+        Bayes_Net.load(path, mmap=mmap)
+
+def test_ask_many_loads_saved_nets(tmp_path):
+    bn = nets[0]
+    path = str(tmp_path / "net.bin")
+    bn.save(path)
+    queries = random_queries(bn, 10, seed=14)
+    results = bn.ask_many(queries, workers=2, path=path)
+    assert all([close(d, bn.variable_elimination_ask(X, e)) for d, (X, e) in zip(results, queries)])
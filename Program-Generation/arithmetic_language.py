@@ -1,7 +1,8 @@
 import enum
 import random
+import numpy as np
 
-from program import Block
+from program import Block, Fuel, Out_Of_Fuel, first_failure
 from cfg import CFG
 
 from language import Language
@@ -163,6 +164,26 @@ def a_to_str(block):
     return Block.rec_block_printer(block, a_sugar)
 
 
+def rand_int():
+    num = 0
+    cont = random.choice([True, False])
+    while cont:
+        num += 1
+        cont = random.choice([True, False])
+    return num
+
+def rand_bool():
+    return random.choice([True, False])
+
+# With fuel, each test of a WHILE condition uses one unit, and assigning
+# an int uses one more for every 64 bits of it, because arithmetic on big
+# ints takes time in proportion to their size. This bounds both loops that
+# never end and loops that grow a number without bound.
+def int_cost(value):
+    if type(value) is int:
+        return value.bit_length() >> 6
+    return 0
+
 # The proper way to call an unbounded runtime block
 # is to create a thread to run the interpreter and kill it 
 # after some maximum runtime. 
@@ -178,12 +199,7 @@ def evaluate_int(block):
     elif block.symbol == Sym.NEG_ONE:
         return -1
     elif block.symbol == Sym.RAND_INT:
-        num = 0
-        cont = random.choice([True, False])
-        while cont:
-            num += 1
-            cont = random.choice([True, False])
-        return num
+        return rand_int()
 
 
 def evaluate_bool(block):
@@ -204,35 +220,293 @@ def evaluate_bool(block):
     elif block.symbol in variable_symbols:
         return block.var.get()
     elif block.symbol == Sym.RAND_BOOL:
-        return random.choice([True, False])
+        return rand_bool()
 
-def a_interpreter(block):
+def a_interpreter(block, fuel = None):
     if block.symbol == Sym.PASS:
         pass
     elif block.symbol == Sym.SEQ:
         for c in block.children:
-            a_interpreter(c)
+            a_interpreter(c, fuel)
     elif block.symbol == Sym.GETS:
-        a_interpreter(block.children[0])
+        a_interpreter(block.children[0], fuel)
     elif block.symbol == Sym.BOOL_BINDING:
         block.children[0].var.set(evaluate_bool(block.children[1]))
     elif block.symbol == Sym.INT_BINDING:
-        block.children[0].var.set(evaluate_int(block.children[1]))
+        value = evaluate_int(block.children[1])
+        if fuel is not None:
+            fuel.burn(int_cost(value))
+        block.children[0].var.set(value)
     elif block.symbol == Sym.IF_THEN_ELSE:
         if evaluate_bool(block.children[0]):
-            a_interpreter(block.children[1])
+            a_interpreter(block.children[1], fuel)
         else:
-            a_interpreter(block.children[2])
+            a_interpreter(block.children[2], fuel)
     elif block.symbol == Sym.WHILE:
+        if fuel is not None:
+            fuel.burn()
         while evaluate_bool(block.children[0]):
-            a_interpreter(block.children[1])
+            a_interpreter(block.children[1], fuel)
+            if fuel is not None:
+                fuel.burn()
     else:
         pass 
 
+# Compilation resolves the symbol dispatch of the functions above once,
+# turning a bound block into a tree of closures. Variables are read
+# through the bound windows when the code runs, so the same compiled
+# block can be rerun after changing inputs.
+def compile_int(block):
+    if block.symbol == Sym.MULT:
+        a, b = compile_int(block.children[0]), compile_int(block.children[1])
+        return lambda: a()*b()
+    elif block.symbol == Sym.PLUS:
+        a, b = compile_int(block.children[0]), compile_int(block.children[1])
+        return lambda: a()+b()
+    elif block.symbol in variable_symbols:
+        return block.var.get
+    elif block.symbol == Sym.ONE:
+        return lambda: 1
+    elif block.symbol == Sym.NEG_ONE:
+        return lambda: -1
+    elif block.symbol == Sym.RAND_INT:
+        return rand_int
+    return lambda: None
+
+def compile_bool(block):
+    if block.symbol == Sym.LESS:
+        a, b = compile_int(block.children[0]), compile_int(block.children[1])
+        return lambda: a() < b()
+    elif block.symbol == Sym.EQUAL:
+        a, b = compile_int(block.children[0]), compile_int(block.children[1])
+        return lambda: a() == b()
+    elif block.symbol == Sym.AND:
+        a, b = compile_bool(block.children[0]), compile_bool(block.children[1])
+        return lambda: a() and b()
+    elif block.symbol == Sym.OR:
+        a, b = compile_bool(block.children[0]), compile_bool(block.children[1])
+        return lambda: a() or b()
+    elif block.symbol == Sym.NEG_BOOL:
+        a = compile_bool(block.children[0])
+        return lambda: not a()
+    elif block.symbol == Sym.TRUE:
+        return lambda: True
+    elif block.symbol == Sym.FALSE:
+        return lambda: False
+    elif block.symbol in variable_symbols:
+        return block.var.get
+    elif block.symbol == Sym.RAND_BOOL:
+        return rand_bool
+    return lambda: None
+
+def nothing():
+    pass
+
+def a_compile(block, fuel = None):
+    """A zero argument function with the effect of a_interpreter(block, fuel)."""
+    if block.symbol == Sym.SEQ:
+        steps = [a_compile(c, fuel) for c in block.children]
+        if len(steps) == 2:
+            first, second = steps
+            def seq():
+                first()
+                second()
+            return seq
+        def seq():
+            for step in steps:
+                step()
+        return seq
+    elif block.symbol == Sym.GETS:
+        return a_compile(block.children[0], fuel)
+    elif block.symbol == Sym.BOOL_BINDING:
+        set_var, value = block.children[0].var.set, compile_bool(block.children[1])
+        return lambda: set_var(value())
+    elif block.symbol == Sym.INT_BINDING:
+        set_var, value = block.children[0].var.set, compile_int(block.children[1])
+        if fuel is None:
+            return lambda: set_var(value())
+        def bind():
+            v = value()
+            fuel.burn(int_cost(v))
+            set_var(v)
+        return bind
+    elif block.symbol == Sym.IF_THEN_ELSE:
+        cond, then, otherwise = compile_bool(block.children[0]), a_compile(block.children[1], fuel), a_compile(block.children[2], fuel)
+        def if_then_else():
+            if cond():
+                then()
+            else:
+                otherwise()
+        return if_then_else
+    elif block.symbol == Sym.WHILE:
+        cond, body = compile_bool(block.children[0]), a_compile(block.children[1], fuel)
+        if fuel is None:
+            def loop():
+                while cond():
+                    body()
+            return loop
+        burn = fuel.burn
+        def fueled_loop():
+            burn()
+            while cond():
+                body()
+                burn()
+        return fueled_loop
+    return nothing
+
+# Lockstep evaluation runs a block once with every variable holding an
+# array of values, one lane per example. It only applies while all lanes
+# take the same path, and while int64 lanes agree with Python ints, so it
+# raises Lockstep_Divergence for anything else and the caller falls back to
+# running the examples one at a time.
+class Lockstep_Divergence(Exception):
+    pass
+
+# Bounds on the operands that keep int64 results exact
+SAFE_PLUS = 2**62
+SAFE_MULT = 2**31
+
+def check_range(a, bound):
+    if np.max(np.abs(a)) >= bound:
+        raise Lockstep_Divergence()
+
+def lockstep_int(block):
+    if block.symbol == Sym.MULT:
+        a, b = lockstep_int(block.children[0]), lockstep_int(block.children[1])
+        check_range(a, SAFE_MULT)
+        check_range(b, SAFE_MULT)
+        return a*b
+    elif block.symbol == Sym.PLUS:
+        a, b = lockstep_int(block.children[0]), lockstep_int(block.children[1])
+        check_range(a, SAFE_PLUS)
+        check_range(b, SAFE_PLUS)
+        return a+b
+    elif block.symbol in variable_symbols:
+        return block.var.get()
+    elif block.symbol == Sym.ONE:
+        return 1
+    elif block.symbol == Sym.NEG_ONE:
+        return -1
+    raise Lockstep_Divergence()
+
+def lockstep_bool(block):
+    if block.symbol == Sym.LESS:
+        return lockstep_int(block.children[0]) < lockstep_int(block.children[1])
+    elif block.symbol == Sym.EQUAL:
+        return lockstep_int(block.children[0]) == lockstep_int(block.children[1])
+    elif block.symbol == Sym.AND:
+        return np.logical_and(lockstep_bool(block.children[0]), lockstep_bool(block.children[1]))
+    elif block.symbol == Sym.OR:
+        return np.logical_or(lockstep_bool(block.children[0]), lockstep_bool(block.children[1]))
+    elif block.symbol == Sym.NEG_BOOL:
+        return np.logical_not(lockstep_bool(block.children[0]))
+    elif block.symbol == Sym.TRUE:
+        return True
+    elif block.symbol == Sym.FALSE:
+        return False
+    elif block.symbol in variable_symbols:
+        return block.var.get()
+    raise Lockstep_Divergence()
+
+def lockstep_branch(cond):
+    """The value of cond in every lane, if they all agree."""
+    if np.all(cond):
+        return True
+    if not np.any(cond):
+        return False
+    raise Lockstep_Divergence()
+
+def lockstep_set(var, value):
+    lanes = var.get()
+    var.set(np.broadcast_to(value, lanes.shape).astype(lanes.dtype))
+
+def a_lockstep_interpreter(block, fuel = None):
+    """a_interpreter over lanes, using up fuel as one lane would."""
+    if block.symbol == Sym.SEQ:
+        for c in block.children:
+            a_lockstep_interpreter(c, fuel)
+    elif block.symbol == Sym.GETS:
+        a_lockstep_interpreter(block.children[0], fuel)
+    elif block.symbol == Sym.BOOL_BINDING:
+        lockstep_set(block.children[0].var, lockstep_bool(block.children[1]))
+    elif block.symbol == Sym.INT_BINDING:
+        # Lanes stay below 2**63, so int_cost would charge nothing
+        lockstep_set(block.children[0].var, lockstep_int(block.children[1]))
+    elif block.symbol == Sym.IF_THEN_ELSE:
+        if lockstep_branch(lockstep_bool(block.children[0])):
+            a_lockstep_interpreter(block.children[1], fuel)
+        else:
+            a_lockstep_interpreter(block.children[2], fuel)
+    elif block.symbol == Sym.WHILE:
+        if fuel is not None:
+            fuel.burn()
+        while lockstep_branch(lockstep_bool(block.children[0])):
+            a_lockstep_interpreter(block.children[1], fuel)
+            if fuel is not None:
+                fuel.burn()
+
+def lockstep_lanes(values, t):
+    if t is int:
+        return np.array(values, dtype=np.int64)
+    return np.array(values, dtype=bool)
+
+def a_lockstep(p, examples, fuel = None):
+    """
+    Whether p.block passes each example, as a boolean array, from one
+    pass over the block with a lane per example. Examples are as for
+    run_examples. Returns None when the lanes would diverge.
+    """
+    examples = list(examples)
+    n = len(examples)
+    if n == 0:
+        return np.ones(0, dtype=bool)
+    if fuel is None:
+        fuel = Fuel()
+    variables = p.get_all_variables()
+    try:
+        for v in variables:
+            v.set(lockstep_lanes(np.zeros(n), v.type))
+        for name in examples[0][0].keys():
+            t = type(examples[0][0][name])
+            p.set_input(t, name, lockstep_lanes([inputs[name] for inputs, outputs in examples], t))
+        expected = dict()
+        for name in examples[0][1].keys():
+            t = type(examples[0][1][name])
+            expected[name] = (t, lockstep_lanes([outputs[name] for inputs, outputs in examples], t))
+        fuel.refill()
+        try:
+            a_lockstep_interpreter(p.block, fuel)
+        except (Out_Of_Fuel, RecursionError):
+            # Every lane would have stopped the same way
+            return np.zeros(n, dtype=bool)
+        passed = np.ones(n, dtype=bool)
+        for name, (t, values) in expected.items():
+            passed &= p.get_output(t, name) == values
+        return passed
+    except (Lockstep_Divergence, OverflowError):
+        return None
+    finally:
+        p.wipe_all_variables()
+
+def a_lockstep_passes(p, examples, fuel = None):
+    """
+    Like a_lockstep, but runs the examples one at a time when the lanes
+    would diverge.
+    """
+    passed = a_lockstep(p, examples, fuel)
+    if passed is not None:
+        return passed
+    if fuel is None:
+        fuel = Fuel()
+    code = a_compile(p.block, fuel)
+    return np.array([first_failure(p, lambda block, fuel: code(), fuel, [e]) is None for e in examples], dtype=bool)
+
 Arithmetic_Language = Language(
     Arithmetic,
     variable_symbols,
     get_variable_options,
     a_interpreter,
     a_sugar,
+    a_compile,
+    a_lockstep,
 )
\ No newline at end of file
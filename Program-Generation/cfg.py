@@ -31,7 +31,94 @@ class PCFG(CFG):
                 self.rules[symbol],
                 self.probs[symbol],
             )[0]
-        
+    def expand(self, symbol):
+        """Samples rules from symbol until a terminal is reached, and
+        returns it with the children of the last rule."""
+        children = ()
+        while symbol in self.rules:
+            symbol, children = self.sample_rule(symbol)
+        return symbol, children
+
+def alias_table(probs):
+    """
+    Walker's alias method (Vose's construction). Column i keeps outcome i
+    with probability keep[i] and otherwise gives alias[i], so a draw costs
+    one uniform number whatever the number of outcomes.
+    """
+    k = len(probs)
+    scaled = [k*p/sum(probs) for p in probs]
+    keep = [1.0 for p in probs]
+    alias = list(range(k))
+    small = [i for i, p in enumerate(scaled) if p < 1.0]
+    large = [i for i, p in enumerate(scaled) if p >= 1.0]
+    while small and large:
+        s, l = small.pop(), large.pop()
+        keep[s] = scaled[s]
+        alias[s] = l
+        scaled[l] -= 1.0 - scaled[s]
+        if scaled[l] < 1.0:
+            small.append(l)
+        else:
+            large.append(l)
+    return keep, alias
+
+class Compiled_PCFG(PCFG):
+    """
+    A PCFG that samples rules from precomputed alias tables, with uniform
+    numbers drawn from NumPy in batches of batch_size.
+    """
+    def __init__(self, start, rules, probs, seed = None, batch_size = 4096):
+        super().__init__(start, rules, probs)
+        self.rng = np.random.default_rng(seed)
+        self.batch_size = batch_size
+        self.tables = dict()
+        # The same tables as arrays, for drawing many rules at once
+        self.batch_tables = dict()
+        for s in rules.keys():
+            keep, alias = alias_table(probs[s])
+            self.tables[s] = (keep, alias, rules[s])
+            self.batch_tables[s] = (np.array(keep), np.array(alias))
+        self.uniforms = []
+        self.used = 0
+    def from_pcfg(g : PCFG, seed = None):
+        return Compiled_PCFG(g.start, g.rules, g.probs, seed)
+    def draw(self, table):
+        """The rule picked by the next uniform number from an entry of tables."""
+        if self.used == len(self.uniforms):
+            self.uniforms = self.rng.random(self.batch_size).tolist()
+            self.used = 0
+        keep, alias, rules = table
+        k = len(keep)
+        x = self.uniforms[self.used]*k
+        self.used += 1
+        i = min(int(x), k-1)
+        return rules[i] if x - i < keep[i] else rules[alias[i]]
+    def sample_rule(self, symbol):
+        table = self.tables.get(symbol)
+        if table is None:
+            return None
+        return self.draw(table)
+    def expand(self, symbol):
+        children = ()
+        table = self.tables.get(symbol)
+        while table is not None:
+            symbol, children = self.draw(table)
+            table = self.tables.get(symbol)
+        return symbol, children
+    def sample_indices(self, symbol, n : int) -> np.ndarray:
+        """Indices into rules[symbol] of n independent draws."""
+        keep, alias = self.batch_tables[symbol]
+        k = len(keep)
+        x = self.rng.random(n)*k
+        i = np.minimum(x.astype(np.intp), k-1)
+        return np.where(x - i < keep[i], i, alias[i])
+    def sample_many(self, symbol, n : int):
+        """n independent draws of sample_rule(symbol)."""
+        if symbol not in self.tables:
+            return [None for i in range(n)]
+        rules = self.rules[symbol]
+        return [rules[i] for i in self.sample_indices(symbol, n).tolist()]
+
 class Color(enum.Enum):
     WHITE = 0
     GRAY  = 1
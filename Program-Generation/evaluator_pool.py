@@ -0,0 +1,122 @@
+from multiprocessing import Process, Pipe
+from multiprocessing.connection import wait
+from typing import List, Tuple, Any
+import os
+import random
+import time
+
+from program import Program, Block, Flat_Block, Fuel, Status, run_examples
+from language import Language
+
+def evaluator_worker(conn, p : Program, l : Language, budget):
+    # Forked workers would otherwise all share the parent's random state
+    random.seed()
+    fuel = Fuel(budget) if budget is not None else None
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        flat, examples = task
+        p.block = flat.to_block(p)
+        code = l.compile(p.block, fuel)
+        conn.send(run_examples(p, lambda block, fuel = None: code(), fuel, examples))
+
+class Evaluator_Worker:
+    def __init__(self, p : Program, l : Language, budget):
+        self.conn, child_conn = Pipe()
+        self.process = Process(target=evaluator_worker, args=(child_conn, p, l, budget), daemon=True)
+        self.process.start()
+        child_conn.close()
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(0.1)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.conn.close()
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+class Evaluator_Pool:
+    """
+    Long lived worker processes that run candidate blocks for a program on
+    batches of examples, for when candidates have to be isolated from the
+    searching process. Each worker runs every candidate under a Fuel with
+    the given budget, and is replaced only if it crashes or a candidate
+    takes longer than timeout seconds anyway, in which case that
+    candidate's examples are all STOPPED, with the outputs as
+    wipe_all_variables leaves them.
+    """
+    def __init__(self, p : Program, l : Language, workers : int = None, budget = 10000, timeout : float = 1.0):
+        self.p = p
+        self.l = l
+        self.budget = budget
+        self.timeout = timeout
+        self.restarts = 0
+        self.workers = [Evaluator_Worker(p, l, budget) for i in range(workers or os.cpu_count())]
+
+    def restart(self, w : int):
+        self.workers[w].kill()
+        self.workers[w] = Evaluator_Worker(self.p, self.l, self.budget)
+        self.restarts += 1
+
+    def evaluate_many(self, blocks : List[Block], examples) -> List[List[Tuple[Status, Any]]]:
+        """The result of run_examples for each of blocks, in order."""
+        def stopped():
+            return [(Status.STOPPED, {name: type(val)() for name, val in outputs.items()}) for inputs, outputs in examples]
+        # Blocks refer to the windows of this process's program, so they are
+        # sent flat, with variables as positions in p.get_all_variables()
+        flat = [Flat_Block.from_block(b, self.p) for b in blocks]
+        results = [None for b in blocks]
+        pending = list(reversed(range(len(blocks))))
+        busy = dict()
+        while pending or busy:
+            for w in range(len(self.workers)):
+                if w in busy or not pending:
+                    continue
+                i = pending.pop()
+                try:
+                    self.workers[w].conn.send((flat[i], examples))
+                except (BrokenPipeError, OSError):
+                    self.restart(w)
+                    self.workers[w].conn.send((flat[i], examples))
+                busy[w] = (i, time.monotonic())
+            conns = {self.workers[w].conn: w for w in busy.keys()}
+            deadline = min([start for i, start in busy.values()]) + self.timeout
+            for conn in wait(list(conns.keys()), max(0.0, deadline - time.monotonic())):
+                w = conns[conn]
+                i, start = busy.pop(w)
+                try:
+                    results[i] = conn.recv()
+                except (EOFError, OSError):
+                    results[i] = stopped()
+                    self.restart(w)
+            now = time.monotonic()
+            for w, (i, start) in list(busy.items()):
+                if now - start > self.timeout:
+                    del busy[w]
+                    results[i] = stopped()
+                    self.restart(w)
+        return results
+
+    def evaluate(self, block : Block, examples) -> List[Tuple[Status, Any]]:
+        return self.evaluate_many([block], examples)[0]
+
+    def close(self):
+        for worker in self.workers:
+            worker.stop()
+        self.workers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -1,8 +1,11 @@
 from cfg import CFG
-from program import Block, Program
+from program import Block, Program, Fuel, Example_Set, first_failure
 import typing
 import random
 
+# Below this many examples, running them one at a time beats a lockstep pass
+LOCKSTEP_MIN_EXAMPLES = 16
+
 class Language:
     def __init__(
         self,
@@ -11,12 +14,18 @@ class Language:
         variable_semantics,
         interpreter,
         syntactic_sugar = None,
+        compiler = None,
+        lockstep = None,
     ):
         self.cfg = cfg
         self.variable_symbols = variable_symbols
         self.variable_semantics = variable_semantics
         self.interpreter = interpreter
         self.sugar = syntactic_sugar
+        self.compiler = compiler
+        # lockstep(p, examples, fuel) runs every example at once, giving
+        # whether each passed, or None if it can't for this block
+        self.lockstep = lockstep
     def get_cfg(self):
         return self.cfg
     def get_variable_symbols(self):
@@ -28,7 +37,49 @@ class Language:
             b.var = random.choice(self.get_variable_options(p, b.symbol))
         for c in b.children:
             self.bind_semantics(p, c)
-    def interpret(self, block):
-        return self.interpreter(block)
+    def interpret(self, block, fuel = None):
+        """Runs the block. Fuel is only passed on when given, so
+        interpreters that take just the block still work."""
+        if fuel is None:
+            return self.interpreter(block)
+        return self.interpreter(block, fuel)
+    def compile(self, block, fuel = None):
+        """
+        A zero argument function that runs the (bound) block, using up
+        fuel if given. Languages without a compiler fall back to calling
+        the interpreter.
+        """
+        if self.compiler is None:
+            return lambda: self.interpret(block, fuel)
+        if fuel is None:
+            return self.compiler(block)
+        return self.compiler(block, fuel)
+    def passes(self, p : Program, examples, fuel : Fuel):
+        """
+        Whether p.block passes every example, compiling it once and
+        stopping at the first failure. Most candidates fail the first
+        example, so that one is always run on its own; if it passes and at
+        least LOCKSTEP_MIN_EXAMPLES remain, they are run all at once by the
+        language's lockstep hook when it has one. The failure is recorded
+        if examples is an Example_Set. Without fuel, the runs are
+        unbounded and the language's code is called without it.
+        """
+        code = self.compile(p.block, fuel)
+        run = lambda block, fuel = None: code()
+        i = first_failure(p, run, fuel, [examples[0]]) if len(examples) > 0 else None
+        if i is None and len(examples) > 1:
+            rest = list(examples)[1:]
+            passed = None
+            if self.lockstep is not None and len(rest) >= LOCKSTEP_MIN_EXAMPLES:
+                passed = self.lockstep(p, rest, fuel)
+            if passed is None:
+                j = first_failure(p, run, fuel, rest)
+            else:
+                j = next((k for k, ok in enumerate(passed) if not ok), None)
+            if j is not None:
+                i = j + 1
+        if i is not None and isinstance(examples, Example_Set):
+            examples.record_failure(i)
+        return i is None
     def print_block(self, block):
         print(Block.rec_block_printer(block, self.sugar))
\ No newline at end of file
@@ -1,8 +1,10 @@
 from threading import Thread
 from time import sleep
 from multiprocessing import Process, Manager
-from typing import Dict, List
+from typing import Dict, List, Any
+from array import array
 import enum
+import math
 # from generative_language import Sym
 
 # TODO: Implement asynchronous window types
@@ -65,6 +67,80 @@ class Block:
         #     child_str += ')'
         # return self.symbol.name + child_str
     
+# A flat block stores a tree of blocks in prefix order as three parallel
+# arrays: the value of each node's symbol, its number of children, and the
+# position of its variable in p.get_all_variables() (-1 if it has none).
+# It takes a few bytes per node, and can be hashed, compared, pickled and
+# measured without walking a tree of objects.
+class Flat_Block:
+    __slots__ = ("symbol_type", "symbols", "arities", "slots")
+    def __init__(self, symbol_type, symbols, arities, slots):
+        self.symbol_type = symbol_type
+        self.symbols = array("i", symbols)
+        self.arities = array("i", arities)
+        self.slots = array("i", slots)
+    def from_block(b : Block, p = None):
+        """Flatten b, whose variables (if any) belong to program p."""
+        positions = dict()
+        if p is not None:
+            positions = {id(v): i for i, v in enumerate(p.get_all_variables())}
+        symbols, arities, slots = [], [], []
+        stack = [b]
+        while stack:
+            b = stack.pop()
+            symbols.append(b.symbol.value)
+            arities.append(len(b.children))
+            if b.var is None:
+                slots.append(-1)
+            elif id(b.var) in positions:
+                slots.append(positions[id(b.var)])
+            elif p is None:
+                raise Exception("Block has variables but no program was given")
+            else:
+                raise Exception("Variable %s is not one of the program's" % b.var.name)
+            stack.extend(reversed(b.children))
+        return Flat_Block(type(b.symbol), symbols, arities, slots)
+    def length(self):
+        return len(self.symbols)
+    def to_block(self, p = None) -> Block:
+        """The tree of Blocks, with variables from program p. Blocks are what
+        the interpreters and compilers run."""
+        members = symbol_members(self.symbol_type)
+        variables = p.get_all_variables() if p is not None else None
+        stack = []
+        for i in range(len(self.symbols)-1, -1, -1):
+            b = Block(members[self.symbols[i]], [stack.pop() for k in range(self.arities[i])])
+            if self.slots[i] >= 0 and variables is not None:
+                b.var = variables[self.slots[i]]
+            stack.append(b)
+        return stack[0]
+    def __eq__(self, other):
+        return (
+            isinstance(other, Flat_Block)
+            and self.symbol_type is other.symbol_type
+            and self.symbols == other.symbols
+            and self.arities == other.arities
+            and self.slots == other.slots
+        )
+    def __hash__(self):
+        return hash((self.symbols.tobytes(), self.arities.tobytes(), self.slots.tobytes()))
+    def __getstate__(self):
+        return (self.symbol_type, self.symbols, self.arities, self.slots)
+    def __setstate__(self, state):
+        self.symbol_type, self.symbols, self.arities, self.slots = state
+    def __repr__(self):
+        return repr(self.to_block())
+
+symbol_member_tables = dict()
+
+def symbol_members(symbol_type):
+    """The members of an enum of symbols, by value."""
+    members = symbol_member_tables.get(symbol_type)
+    if members is None:
+        members = {s.value: s for s in symbol_type}
+        symbol_member_tables[symbol_type] = members
+    return members
+
 # TODO: Blocks with pointers should be the only actual construct outside of the CFG definition.
 # They will carry a symbol and sometimes indexing information for locals and windows, as well as
 # an (often empty) list of child blocks. 
@@ -75,6 +151,23 @@ class Status(enum.Enum):
     STOPPED    = 2
     FINISHED   = 3
 
+class Out_Of_Fuel(Exception):
+    pass
+
+# Fuel bounds the work of one run of an interpreter in the same process,
+# in place of a wall clock timeout. Interpreters call burn as they go and
+# the run is abandoned with Out_Of_Fuel once the budget is used up.
+class Fuel:
+    def __init__(self, budget = math.inf):
+        self.budget = budget
+        self.left = budget
+    def refill(self):
+        self.left = self.budget
+    def burn(self, amount = 1):
+        self.left -= amount
+        if self.left < 0:
+            raise Out_Of_Fuel()
+
 # A program manages an environment, input and output memory locations
 # (which may be anytime modifiable and readable) and a block.
 # Searching over blocks is best handled externally to the program class; 
@@ -137,6 +230,10 @@ class Program:
                 return
         raise Exception("Variable not found")
 
+    def set_inputs(self, values : Dict[str, Any]):
+        for name, val in values.items():
+            self.set_input(type(val), name, val)
+
     def get_output(self, t : type, name : str):
         for y in self.outs[t]:
             if y.name == name:
@@ -171,3 +268,70 @@ def run_for_time(p : Program, interpreter, timeout : int):
             for i, y in enumerate(return_dict["outputs"][t]):
                 p.outs[t][i].set(y.get()) 
         p.status = Status.FINISHED
+
+# Blocking, run program in this process until it finishes or its fuel runs out.
+# The interpreter is called as interpreter(block, fuel), or as
+# interpreter(block) when fuel is None, which leaves the run unbounded.
+def run_with_fuel(p : Program, interpreter, fuel : Fuel):
+    p.status = Status.RUNNING
+    try:
+        if fuel is None:
+            interpreter(p.block)
+        else:
+            fuel.refill()
+            interpreter(p.block, fuel)
+    except (Out_Of_Fuel, RecursionError):
+        p.status = Status.STOPPED
+        return p.status
+    p.status = Status.FINISHED
+    return p.status
+
+# An example is a pair of dictionaries from window names to values: the
+# inputs to set and the outputs expected. Running examples gives, for each,
+# the status of the run and the values of the expected outputs after it.
+def run_examples(p : Program, interpreter, fuel : Fuel, examples):
+    results = []
+    for inputs, outputs in examples:
+        p.wipe_all_variables()
+        p.set_inputs(inputs)
+        status = run_with_fuel(p, interpreter, fuel)
+        results.append((status, {name: p.get_output(type(val), name) for name, val in outputs.items()}))
+    return results
+
+# Like run_examples, but stops at the first example where the run doesn't
+# finish or an output differs from the expected value, returning its index.
+# Returns None if every example passes.
+def first_failure(p : Program, interpreter, fuel : Fuel, examples):
+    for i, (inputs, outputs) in enumerate(examples):
+        p.wipe_all_variables()
+        p.set_inputs(inputs)
+        if run_with_fuel(p, interpreter, fuel) != Status.FINISHED:
+            return i
+        for name, val in outputs.items():
+            if p.get_output(type(val), name) != val:
+                return i
+    return None
+
+# Examples ordered by how many candidates each has rejected, so that the
+# most discriminating ones run first and most bad candidates are rejected
+# after a single run.
+class Example_Set:
+    def __init__(self, examples, reorder = True):
+        self.examples = list(examples)
+        self.rejections = [0 for e in self.examples]
+        self.reorder = reorder
+    def __len__(self):
+        return len(self.examples)
+    def __getitem__(self, i):
+        return self.examples[i]
+    def __iter__(self):
+        return iter(self.examples)
+    def record_failure(self, i : int):
+        self.rejections[i] += 1
+        if not self.reorder:
+            return
+        # Move the example up past any that have rejected fewer candidates
+        while i > 0 and self.rejections[i] > self.rejections[i-1]:
+            self.examples[i-1], self.examples[i] = self.examples[i], self.examples[i-1]
+            self.rejections[i-1], self.rejections[i] = self.rejections[i], self.rejections[i-1]
+            i -= 1
@@ -0,0 +1,432 @@
+import math
+import random
+
+from collections import OrderedDict
+
+from program import Program, Block, Flat_Block, Fuel
+from cfg import CFG, PCFG, Compiled_PCFG, cfg_to_solomonoff_pcfg
+
+from language import Language
+
+# Symbols of the arithmetic language, which the searchers build blocks from
+from arithmetic_language import Sym
+
+# The combination of CFG and interpreter should "plug in" to the program class. Ideally the search process 
+# with also work for an arbitrary CFG and interpreter. 
+
+def random_block_search(l : Language, p : Program, s : Sym = -1):
+    g = l.get_cfg()
+    if s == -1:
+        s = g.start
+    nonterminals = g.rules.keys()
+    children = []
+    while s in nonterminals:
+        cand_s, children = random.choice(g.rules[s])
+        # Each length increase should have probability 1/2
+        # Roughly speaking, this means a symbol with n children
+        # should be 2^n times less likely. 
+        undo = False
+        for c in children:
+            undo = undo or random.choice([True, False])
+        if not undo:
+            s = cand_s
+        #s = cand_s
+    b = Block(s)
+    for c in children:
+        # the children of a block should be blocks
+        b.children.append(random_block_search(l, p, c))
+    if b.symbol in l.get_variable_symbols():
+        b.var = random.choice(l.get_variable_options(p, b.symbol))
+    return b
+
+def sample_pcfg(g : PCFG, s : Sym = -1):
+    if s == -1:
+        s = g.start
+    nonterminals = g.rules.keys()
+    children = []
+    while s in nonterminals:
+        s, children = g.sample_rule(s)
+    b = Block(s)
+    for c in children:
+        # the children of a block should be blocks
+        b.children.append(sample_pcfg(g, c))
+    return b
+
+# The samplers below expand one symbol at a time from an explicit stack
+# instead of recursing, writing the tree in prefix order into two flat
+# lists: the symbol of each node and its number of children. Sampling
+# gives up and returns None as soon as the tree is known to be larger than
+# max_size nodes or deeper than max_depth, so the cost of a draw is
+# bounded, and Blocks are only made for the trees that are kept.
+def sample_bounded(resolve, s, max_size : int = None, max_depth : int = None):
+    s, children = resolve(s)
+    if not children:
+        return Block(s)
+    if max_size is None:
+        max_size = math.inf
+    if max_depth is None:
+        max_depth = math.inf
+    symbols = [s]
+    arities = [len(children)]
+    stack = [(c, 1) for c in reversed(children)]
+    if 1 + len(stack) > max_size or 1 > max_depth:
+        return None
+    while stack:
+        s, depth = stack.pop()
+        if depth > max_depth:
+            return None
+        s, children = resolve(s)
+        symbols.append(s)
+        arities.append(len(children))
+        if children:
+            stack.extend([(c, depth+1) for c in reversed(children)])
+            if len(symbols) + len(stack) > max_size:
+                return None
+    return block_from_prefix(symbols, arities)
+
+def block_from_prefix(symbols, arities) -> Block:
+    """The Block tree whose nodes in prefix order have these symbols and
+    numbers of children."""
+    stack = []
+    for s, k in zip(reversed(symbols), reversed(arities)):
+        stack.append(Block(s, [stack.pop() for i in range(k)]))
+    return stack[0]
+
+def random_resolver(g : CFG):
+    def resolve(s):
+        children = []
+        while s in g.rules:
+            cand_s, children = random.choice(g.rules[s])
+            undo = False
+            for c in children:
+                undo = undo or random.choice([True, False])
+            if not undo:
+                s = cand_s
+        return s, children
+    return resolve
+
+def sample_pcfg_bounded(g : PCFG, s : Sym = -1, max_size : int = None, max_depth : int = None):
+    """Same distribution as sample_pcfg, conditioned on the bounds, or None."""
+    if s == -1:
+        s = g.start
+    return sample_bounded(g.expand, s, max_size, max_depth)
+
+def random_block_search_bounded(l : Language, p : Program, s : Sym = -1, max_size : int = None, max_depth : int = None):
+    """Same distribution as random_block_search, conditioned on the bounds, or None."""
+    g = l.get_cfg()
+    if s == -1:
+        s = g.start
+    b = sample_bounded(random_resolver(g), s, max_size, max_depth)
+    if b is not None:
+        l.bind_semantics(p, b)
+    return b
+
+def block_extent(b : Block):
+    """The number of nodes of b and its depth, where a lone node has depth 0."""
+    size = 0
+    depth = 0
+    stack = [(b, 0)]
+    while stack:
+        b, d = stack.pop()
+        size += 1
+        depth = max(depth, d)
+        stack.extend([(c, d+1) for c in b.children])
+    return size, depth
+
+def function_search(l : Language, p: Program, s : Sym = -1):
+    """
+        This search method imposes the requirement that after running some initial code,
+        each output variable is assigned to.
+    """
+    b = Block(Sym.SEQ)
+    b.children.append(random_block_search(l, p, s))
+    assignments = None
+    for int_output in p.outs[int]:
+        y = Block(Sym.WINDOW_INT)
+        y.var = int_output
+        assign = Block(Sym.GETS, [Block(Sym.INT_BINDING, [y, random_block_search(l, p, Sym.INT_EXP)])])
+        if assignments is None:
+            assignments = assign 
+        else:
+            assignments = Block(Sym.SEQ, [assignments, assign])
+    for bool_output in p.outs[bool]:
+        y = Block(Sym.WINDOW_BOOL)
+        y.var = bool_output
+        assign = Block(Sym.GETS, [Block(Sym.BOOL_BINDING, [y, random_block_search(l, p, Sym.BOOL_EXP)])])
+        if assignments is None:
+            assignments = assign 
+        else:
+            assignments = Block(Sym.SEQ, [assignments, assign])
+    b.children.append(assignments)
+    return b
+
+def function_sample(g : PCFG, p : Program, s : Sym = -1, max_size : int = None, max_depth : int = None):
+    """
+        This search method imposes the requirement that after running some initial code,
+        each output variable is assigned to. Returns None if the whole block
+        has more than max_size nodes or is deeper than max_depth.
+    """
+    body = sample_pcfg_bounded(g, s, max_size, max_depth)
+    if body is None:
+        return None
+    b = Block(Sym.SEQ, [body])
+    assignments = None
+    for int_output in p.outs[int]:
+        y = Block(Sym.WINDOW_INT)
+        y.var = int_output
+        e = sample_pcfg_bounded(g, Sym.INT_EXP, max_size, max_depth)
+        if e is None:
+            return None
+        assign = Block(Sym.GETS, [Block(Sym.INT_BINDING, [y, e])])
+        if assignments is None:
+            assignments = assign 
+        else:
+            assignments = Block(Sym.SEQ, [assignments, assign])
+    for bool_output in p.outs[bool]:
+        y = Block(Sym.WINDOW_BOOL)
+        y.var = bool_output
+        e = sample_pcfg_bounded(g, Sym.BOOL_EXP, max_size, max_depth)
+        if e is None:
+            return None
+        assign = Block(Sym.GETS, [Block(Sym.BOOL_BINDING, [y, e])])
+        if assignments is None:
+            assignments = assign 
+        else:
+            assignments = Block(Sym.SEQ, [assignments, assign])
+    b.children.append(assignments)
+    # Each part is within the bounds on its own, which keeps every draw
+    # cheap; the whole block is checked here
+    if max_size is None and max_depth is None:
+        return b
+    size, depth = block_extent(b)
+    if max_size is not None and size > max_size:
+        return None
+    if max_depth is not None and depth > max_depth:
+        return None
+    return b
+
+class Candidate_Cache:
+    """
+    Test outcomes of candidates, keyed on their Flat_Block (so including
+    variable bindings), so that repeated candidates needn't be run again.
+    Holds at most capacity candidates, dropping the least recently used.
+    Outcomes are only meaningful for one program, one set of examples and
+    one fuel budget, so the cache is tied to the program's variables, the
+    examples and the budget last passed to use. Candidates containing a
+    volatile symbol can give a different outcome on every run and are
+    never cached.
+    """
+    def __init__(self, capacity : int = 100000, volatile = (Sym.RAND_INT, Sym.RAND_BOOL)):
+        self.capacity = capacity
+        self.volatile = set([s.value for s in volatile])
+        self.outcomes = OrderedDict()
+        self.examples = None
+        self.budget = None
+        self.variables = []
+        self.hits = 0
+        self.misses = 0
+    def use(self, p : Program, examples, fuel : Fuel):
+        """Ties the cache to p's variables, examples (which must not change
+        while tied) and fuel's budget, forgetting any outcomes from others.
+        Keys name variables by position in p.get_all_variables(), so the
+        same key means a different candidate once a local is added."""
+        budget = fuel.budget if fuel is not None else math.inf
+        variables = p.get_all_variables()
+        if (
+            examples is not self.examples
+            or budget != self.budget
+            or len(variables) != len(self.variables)
+            or any([a is not b for a, b in zip(variables, self.variables)])
+        ):
+            self.outcomes.clear()
+            self.examples = examples
+            self.budget = budget
+            self.variables = variables
+    def cacheable(self, key : Flat_Block):
+        return not any([s in self.volatile for s in key.symbols])
+    def __len__(self):
+        return len(self.outcomes)
+    def __contains__(self, key : Flat_Block):
+        return key in self.outcomes
+    def get(self, key : Flat_Block):
+        if key not in self.outcomes:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.outcomes.move_to_end(key)
+        return self.outcomes[key]
+    def put(self, key : Flat_Block, outcome):
+        self.outcomes[key] = outcome
+        self.outcomes.move_to_end(key)
+        if len(self.outcomes) > self.capacity:
+            self.outcomes.popitem(last=False)
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits/lookups if lookups else 0.0
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.outcomes), "hit_rate": self.hit_rate()}
+
+class Searcher:
+    def __init__(self, l : Language, p : Program, cache : Candidate_Cache = None):
+        self.l = l
+        self.p = p
+        self.cache = cache
+    def search(self):
+        pass
+    def passes(self, b : Block, examples, fuel : Fuel):
+        """Sets p.block to b and tests it, answering from the cache for
+        candidates already tested on the same examples and fuel."""
+        self.p.block = b
+        if self.cache is None:
+            return self.l.passes(self.p, examples, fuel)
+        self.cache.use(self.p, examples, fuel)
+        key = Flat_Block.from_block(b, self.p)
+        if not self.cache.cacheable(key):
+            return self.l.passes(self.p, examples, fuel)
+        outcome = self.cache.get(key)
+        if outcome is None:
+            outcome = self.l.passes(self.p, examples, fuel)
+            self.cache.put(key, outcome)
+        return outcome
+
+# Unbounded draws can be deep enough to overflow the recursion of
+# bind_semantics and the interpreters, so the samplers are bounded by
+# default; pass None to lift a bound. Bounds that no block (or almost no
+# block) meets would have the samplers redraw forever, so they give up
+# after max_tries draws in a row are rejected. Rules are drawn from a
+# generator seeded with seed, and variables are bound with random, so a
+# search is reproduced by the same seed and random.seed.
+class Solomonoff_sampler(Searcher):
+    def __init__(self, l : Language, p : Program, max_size : int = 200, max_depth : int = 50, cache : Candidate_Cache = None, max_tries : int = 10000, seed = None):
+        super().__init__(l, p, cache)
+        self.pcfg = Compiled_PCFG.from_pcfg(cfg_to_solomonoff_pcfg(l.get_cfg(), True), seed)
+        self.max_size = max_size
+        self.max_depth = max_depth
+        self.max_tries = max_tries
+        self.rejected = 0
+    def sample(self):
+        return sample_pcfg_bounded(self.pcfg, max_size=self.max_size, max_depth=self.max_depth)
+    def search(self):
+        for i in range(self.max_tries):
+            b = self.sample()
+            if b is not None:
+                self.l.bind_semantics(self.p, b)
+                return b
+            self.rejected += 1
+        raise Exception("No block within max_size %s and max_depth %s in %d tries" % (self.max_size, self.max_depth, self.max_tries))
+
+class Solomonoff_function_sampler(Solomonoff_sampler):
+    def sample(self):
+        return function_sample(self.pcfg, self.p, max_size=self.max_size, max_depth=self.max_depth)
+
+def leaf(symbol : Sym, var = None):
+    b = Block(symbol)
+    b.var = var
+    return b
+
+class Bottom_Up_Searcher(Searcher):
+    """
+    Enumerates Arithmetic_Language expressions from smallest to largest,
+    evaluating each on the inputs of the examples as it is built. Only the
+    first expression found for each vector of values is kept and combined
+    into larger ones, since any other would behave the same on the
+    examples. search returns a block assigning an expression to each
+    expected output, or None if there is none with up to max_size nodes.
+    """
+    def __init__(self, l : Language, p : Program, examples, max_size : int = 9):
+        super().__init__(l, p)
+        self.examples = list(examples)
+        # The examples are what say which outputs to assign
+        if not self.examples:
+            raise Exception("Bottom up search needs at least one example")
+        self.max_size = max_size
+        self.considered = 0
+
+    def leaves(self):
+        """Variables with their values on each example, before any assignment."""
+        variables = self.p.get_all_variables()
+        rows = []
+        for inputs, outputs in self.examples:
+            self.p.wipe_all_variables()
+            self.p.set_inputs(inputs)
+            rows.append([v.get() for v in variables])
+        self.p.wipe_all_variables()
+        values = {id(v): tuple([row[i] for row in rows]) for i, v in enumerate(variables)}
+        # Outputs are left out, as they read the same as an unassigned local
+        int_leaves = [(values[id(v)], leaf(Sym.LOCAL_INT, v)) for v in self.l.get_variable_options(self.p, Sym.LOCAL_INT)]
+        int_leaves += [(values[id(v)], leaf(Sym.WINDOW_INT, v)) for v in self.p.ins[int]]
+        bool_leaves = [(values[id(v)], leaf(Sym.LOCAL_BOOL, v)) for v in self.l.get_variable_options(self.p, Sym.LOCAL_BOOL)]
+        bool_leaves += [(values[id(v)], leaf(Sym.WINDOW_BOOL, v)) for v in self.p.ins[bool]]
+        n = len(self.examples)
+        int_leaves += [((1,)*n, leaf(Sym.ONE)), ((-1,)*n, leaf(Sym.NEG_ONE))]
+        bool_leaves += [((True,)*n, leaf(Sym.TRUE)), ((False,)*n, leaf(Sym.FALSE))]
+        return int_leaves, bool_leaves
+
+    def keep(self, bank, seen, values, b):
+        self.considered += 1
+        if values not in seen:
+            seen[values] = b
+            bank.append((values, b))
+
+    def grow_int(self, banks, seen, size):
+        bank = []
+        for i in range(1, size-1):
+            j = size-1-i
+            if i > j:
+                break
+            for a_values, a in banks[i]:
+                for b_values, b in banks[j]:
+                    self.keep(bank, seen, tuple([x+y for x, y in zip(a_values, b_values)]), Block(Sym.PLUS, [a, b]))
+                    self.keep(bank, seen, tuple([x*y for x, y in zip(a_values, b_values)]), Block(Sym.MULT, [a, b]))
+        return bank
+
+    def grow_bool(self, banks, int_banks, seen, size):
+        bank = []
+        for a_values, a in banks[size-1]:
+            self.keep(bank, seen, tuple([not x for x in a_values]), Block(Sym.NEG_BOOL, [a]))
+        for i in range(1, size-1):
+            j = size-1-i
+            for a_values, a in int_banks[i]:
+                for b_values, b in int_banks[j]:
+                    self.keep(bank, seen, tuple([x < y for x, y in zip(a_values, b_values)]), Block(Sym.LESS, [a, b]))
+                    if i <= j:
+                        self.keep(bank, seen, tuple([x == y for x, y in zip(a_values, b_values)]), Block(Sym.EQUAL, [a, b]))
+            if i > j:
+                continue
+            for a_values, a in banks[i]:
+                for b_values, b in banks[j]:
+                    self.keep(bank, seen, tuple([x and y for x, y in zip(a_values, b_values)]), Block(Sym.AND, [a, b]))
+                    self.keep(bank, seen, tuple([x or y for x, y in zip(a_values, b_values)]), Block(Sym.OR, [a, b]))
+        return bank
+
+    def search(self):
+        targets = []
+        for name in self.examples[0][1].keys():
+            t = type(self.examples[0][1][name])
+            window = [y for y in self.p.outs[t] if y.name == name][0]
+            targets.append((t, window, tuple([outputs[name] for inputs, outputs in self.examples])))
+        int_leaves, bool_leaves = self.leaves()
+        int_banks, bool_banks = [[], []], [[], []]
+        int_seen, bool_seen = dict(), dict()
+        for values, b in int_leaves:
+            self.keep(int_banks[1], int_seen, values, b)
+        for values, b in bool_leaves:
+            self.keep(bool_banks[1], bool_seen, values, b)
+        for size in range(1, self.max_size+1):
+            if size > 1:
+                int_banks.append(self.grow_int(int_banks, int_seen, size))
+                bool_banks.append(self.grow_bool(bool_banks, int_banks, bool_seen, size))
+            found = [(int_seen if t is int else bool_seen).get(values) for t, window, values in targets]
+            if all([e is not None for e in found]):
+                return self.assign([(t, window, e) for (t, window, values), e in zip(targets, found)])
+        return None
+
+    def assign(self, solutions):
+        b = None
+        for t, window, e in solutions:
+            if t is int:
+                assign = Block(Sym.GETS, [Block(Sym.INT_BINDING, [leaf(Sym.INT_LVAL, window), e])])
+            else:
+                assign = Block(Sym.GETS, [Block(Sym.BOOL_BINDING, [leaf(Sym.BOOL_LVAL, window), e])])
+            b = assign if b is None else Block(Sym.SEQ, [b, assign])
+        return b
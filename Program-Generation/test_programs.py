@@ -0,0 +1,291 @@
+import random
+import pickle
+import numpy as np
+import pytest
+
+from program import Program, Block, Box, Flat_Block, Fuel, Status, Example_Set, run_with_fuel, run_examples
+from arithmetic_language import Sym, Arithmetic_Language, a_interpreter, a_compile, a_lockstep_passes
+from language import Language
+from cfg import Compiled_PCFG, alias_table, cfg_to_solomonoff_pcfg
+from evaluator_pool import Evaluator_Pool
+import searchers
+
+l = Arithmetic_Language
+
+def make_program():
+    p = Program({int: [Box(int, "X")], bool: []}, {int: [Box(int, "Y")], bool: []})
+    for i in range(2):
+        p.add_int_local()
+        p.add_bool_local()
+    return p
+
+def sample_block(rng, s = None, depth = 0, loops = True):
+    """A random derivation of the arithmetic grammar, choosing rules
+    uniformly and only leaves below depth 4. Without loops, WHILE is
+    never chosen."""
+    g = l.get_cfg()
+    s = g.start if s is None else s
+    children = []
+    while s in g.rules:
+        options = [o for o in g.rules[s] if loops or o[0] != Sym.WHILE]
+        if depth > 4:
+            options = [o for o in options if not o[1] and o[0] not in (Sym.COMP, Sym.BOOL_OP, Sym.INT_OP)] or options
+        s, children = rng.choice(options)
+    return Block(s, [sample_block(rng, c, depth+1, loops) for c in children])
+
+def is_random(b):
+    return b.symbol in (Sym.RAND_INT, Sym.RAND_BOOL) or any([is_random(c) for c in b.children])
+
+def sampled_programs(count, seed = 0, loops = True):
+    """count bound, deterministic blocks for a fresh program each."""
+    rng = random.Random(seed)
+    random.seed(seed)
+    found = []
+    while len(found) < count:
+        p = make_program()
+        b = sample_block(rng, loops=loops)
+        if is_random(b):
+            continue
+        l.bind_semantics(p, b)
+        found.append((p, b))
+    return found
+
+inputs = list(range(-3, 7))
+
+def final_state(p, b, interpreter, fuel, x):
+    """The status of running b on p from input x, and the value of every
+    variable of p after it."""
+    p.block = b
+    p.wipe_all_variables()
+    p.set_input(int, "X", x)
+    status = run_with_fuel(p, interpreter, fuel)
+    return status, [v.get() for v in p.get_all_variables()]
+
+def test_interpreter_compiled_and_flat_agree():
+    fuel = Fuel(300)
+    for p, b in sampled_programs(300):
+        code = a_compile(b, fuel)
+        flat = Flat_Block.from_block(b, p)
+        for x in inputs:
+            expected = final_state(p, b, a_interpreter, fuel, x)
+            assert final_state(p, b, lambda block, fuel: code(), fuel, x) == expected
+            assert final_state(p, flat.to_block(p), a_interpreter, fuel, x) == expected
+        assert Flat_Block.from_block(flat.to_block(p), p) == flat
+        assert flat.length() == b.length()
+
+def test_flat_blocks_hash_pickle_and_reject_foreign_variables():
+    p, b = sampled_programs(1, seed=2)[0]
+    flat = Flat_Block.from_block(b, p)
+    copy = pickle.loads(pickle.dumps(flat))
+    assert copy == flat and hash(copy) == hash(flat)
+    assert repr(copy.to_block(p)) == repr(b)
+    y = Block(Sym.WINDOW_INT)
+    y.var = p.outs[int][0]
+    with pytest.raises(Exception, match="no program"):
+        Flat_Block.from_block(y)
+    with pytest.raises(Exception, match="not one of the program's"):
+        Flat_Block.from_block(y, make_program())
+
+def test_fuel_stops_endless_loops():
+    p = make_program()
+    b = Block(Sym.WHILE, [Block(Sym.TRUE), Block(Sym.PASS)])
+    fuel = Fuel(1000)
+    assert final_state(p, b, a_interpreter, fuel, 0)[0] == Status.STOPPED
+    assert final_state(p, b, lambda block, fuel: a_compile(block, fuel)(), fuel, 0)[0] == Status.STOPPED
+    # Squaring a local forever is stopped by the charge on big ints
+    y = Block(Sym.LOCAL_INT)
+    square = Block(Sym.GETS, [Block(Sym.INT_BINDING, [y, Block(Sym.MULT, [y, y])])])
+    b = Block(Sym.SEQ, [Block(Sym.GETS, [Block(Sym.INT_BINDING, [y, Block(Sym.PLUS, [Block(Sym.ONE), Block(Sym.ONE)])])]), Block(Sym.WHILE, [Block(Sym.TRUE), square])])
+    y.var = p.int_locals[0]
+    assert final_state(p, b, a_interpreter, Fuel(10**6), 0)[0] == Status.STOPPED
+
+def test_fuel_is_optional_for_languages():
+    ran = []
+    plain = Language(l.get_cfg(), l.get_variable_symbols(), l.variable_semantics, ran.append)
+    b = Block(Sym.PASS)
+    plain.interpret(b)
+    plain.compile(b)()
+    assert ran == [b, b]
+    fuel = Fuel(5)
+    l.compile(Block(Sym.WHILE, [Block(Sym.FALSE), Block(Sym.PASS)]), fuel)()
+    assert fuel.left == 4
+    # Testing examples without fuel calls the interpreter with the block alone
+    p = make_program()
+    p.block = add_one(p)
+    fuelless = Language(l.get_cfg(), l.get_variable_symbols(), l.variable_semantics, lambda block: a_interpreter(block))
+    assert fuelless.passes(p, [({"X": x}, {"Y": x+1}) for x in inputs], None)
+    assert not fuelless.passes(p, [({"X": 1}, {"Y": 0})], None)
+
+def add_one(p):
+    """Y := X + 1, bound to p's windows."""
+    x, y = Block(Sym.WINDOW_INT), Block(Sym.INT_LVAL)
+    x.var, y.var = p.ins[int][0], p.outs[int][0]
+    return Block(Sym.GETS, [Block(Sym.INT_BINDING, [y, Block(Sym.PLUS, [x, Block(Sym.ONE)])])])
+
+def test_evaluator_pool_times_out_and_restarts():
+    p = make_program()
+    examples = [({"X": x}, {"Y": x+1}) for x in inputs]
+    expected = [(Status.FINISHED, {"Y": x+1}) for x in inputs]
+    endless = Block(Sym.WHILE, [Block(Sym.TRUE), Block(Sym.PASS)])
+    with Evaluator_Pool(p, l, workers=1, budget=10**12, timeout=0.3) as pool:
+        assert pool.evaluate_many([add_one(p), endless, add_one(p)], examples) == [expected, [(Status.STOPPED, {"Y": 0}) for x in inputs], expected]
+        assert pool.restarts == 1
+        pool.workers[0].process.kill()
+        pool.workers[0].process.join()
+        assert pool.evaluate(add_one(p), examples) == expected
+        assert pool.restarts == 2
+
+def test_example_set_moves_discriminating_examples_forward():
+    p = make_program()
+    one = Block(Sym.GETS, [Block(Sym.INT_BINDING, [Block(Sym.INT_LVAL), Block(Sym.ONE)])])
+    one.children[0].children[0].var = p.outs[int][0]
+    fuel = Fuel(100)
+    pairs = [({"X": x}, {"Y": x+1}) for x in range(4)]
+    examples = Example_Set(pairs)
+    p.block = one
+    assert not l.passes(p, examples, fuel)
+    assert [e[0]["X"] for e in examples] == [1, 0, 2, 3]
+    examples.record_failure(3)
+    examples.record_failure(1)
+    assert [e[0]["X"] for e in examples] == [3, 1, 0, 2]
+    assert examples.rejections == [2, 1, 0, 0]
+    p.block = add_one(p)
+    assert l.passes(p, examples, fuel)
+    assert [e[0]["X"] for e in examples] == [3, 1, 0, 2]
+    fixed = Example_Set(pairs, reorder=False)
+    p.block = one
+    assert not l.passes(p, fixed, fuel)
+    assert list(fixed) == pairs and fixed.rejections == [0, 1, 0, 0]
+
+def test_lockstep_agrees_with_one_at_a_time():
+    fuel = Fuel(300)
+    many = [{"X": x} for x in range(-10, 20)]
+    for p, b in sampled_programs(300, seed=1):
+        p.block = b
+        results = run_examples(p, a_interpreter, fuel, [(i, {"Y": 0}) for i in many])
+        examples = [(i, outputs) for i, (status, outputs) in zip(many, results)]
+        passed = a_lockstep_passes(p, examples, fuel)
+        assert list(passed) == [status == Status.FINISHED for status, outputs in results]
+        assert l.passes(p, examples, fuel) == all(passed)
+        wrong = [(i, {"Y": outputs["Y"] + 1}) for i, outputs in examples]
+        assert not any(a_lockstep_passes(p, wrong, fuel))
+        assert not l.passes(p, wrong, fuel)
+
+def test_lockstep_handles_no_examples_and_no_fuel():
+    p, b = sampled_programs(1)[0]
+    p.block = b
+    assert len(a_lockstep_passes(p, [], None)) == 0
+    assert l.passes(p, [], None)
+
+def test_alias_tables_match_rule_probabilities():
+    probs = [0.5, 0.2, 0.2, 0.05, 0.05]
+    keep, alias = alias_table(probs)
+    k = len(probs)
+    implied = [keep[i]/k + sum([(1 - keep[j])/k for j in range(k) if alias[j] == i]) for i in range(k)]
+    assert np.allclose(implied, probs)
+    assert alias_table([1, 1, 1]) == ([1.0, 1.0, 1.0], [0, 1, 2])
+    rules = [(s, []) for s in (Sym.ONE, Sym.NEG_ONE, Sym.RAND_INT, Sym.LOCAL_INT, Sym.WINDOW_INT)]
+    g = Compiled_PCFG(Sym.INT_BASIC, {Sym.INT_BASIC: rules}, {Sym.INT_BASIC: probs}, seed=0)
+    n = 200000
+    counts = np.bincount(g.sample_indices(Sym.INT_BASIC, n), minlength=k)
+    assert np.abs(counts/n - probs).max() < 0.01
+    counts = np.bincount([rules.index(g.sample_rule(Sym.INT_BASIC)) for i in range(n)], minlength=k)
+    assert np.abs(counts/n - probs).max() < 0.01
+    assert all([r in rules for r in g.sample_many(Sym.INT_BASIC, 100)])
+    assert g.sample_many(Sym.ONE, 3) == [None, None, None] and g.sample_rule(Sym.ONE) is None
+
+def test_bounded_samplers_match_recursive_ones_and_keep_bounds():
+    g = Compiled_PCFG.from_pcfg(cfg_to_solomonoff_pcfg(l.get_cfg(), True), seed=0)
+    same = Compiled_PCFG.from_pcfg(g, seed=0)
+    for i in range(2000):
+        assert repr(searchers.sample_pcfg_bounded(same)) == repr(searchers.sample_pcfg(g))
+    for s in (Sym.EXEC, Sym.INT_EXP, Sym.BOOL_EXP):
+        kept = 0
+        for i in range(2000):
+            b = searchers.sample_pcfg_bounded(g, s, max_size=5, max_depth=2)
+            if b is not None:
+                kept += 1
+                size, depth = searchers.block_extent(b)
+                assert size <= 5 and depth <= 2
+        assert kept > 0
+    p = make_program()
+    random.seed(0)
+    kept = 0
+    for i in range(2000):
+        b = searchers.random_block_search_bounded(l, p, max_size=8, max_depth=3)
+        if b is not None:
+            kept += 1
+            size, depth = searchers.block_extent(b)
+            assert size <= 8 and depth <= 3
+            # Every variable is bound to one of p's
+            assert Flat_Block.from_block(b, p).to_block(p).length() == size
+    assert kept > 0
+    for i in range(50):
+        b = searchers.function_search(l, p)
+        assert b.symbol == Sym.SEQ and Flat_Block.from_block(b, p).length() == b.length()
+    sampler = searchers.Solomonoff_function_sampler(l, p)
+    for i in range(2000):
+        size, depth = searchers.block_extent(sampler.search())
+        assert size <= sampler.max_size and depth <= sampler.max_depth
+    draws = []
+    for i in range(2):
+        random.seed(3)
+        sampler = searchers.Solomonoff_function_sampler(l, p, seed=3)
+        draws.append([repr(sampler.search()) for k in range(50)])
+    assert draws[0] == draws[1]
+    # An int output alone takes six nodes
+    with pytest.raises(Exception, match="No block within max_size 5"):
+        searchers.Solomonoff_function_sampler(l, p, max_size=5).search()
+
+def test_bottom_up_search_finds_the_smallest_expressions():
+    p = Program({int: [Box(int, "X")], bool: []}, {int: [Box(int, "Y")], bool: [Box(bool, "Z")]})
+    p.add_int_local()
+    p.add_bool_local()
+    fuel = Fuel(100)
+    for f, size in [(lambda x: x+1, 3), (lambda x: x*x + x, 5), (lambda x: 2*x*x - 1, 7)]:
+        examples = [({"X": x}, {"Y": f(x), "Z": x < 2}) for x in range(-2, 5)]
+        searcher = searchers.Bottom_Up_Searcher(l, p, examples)
+        p.block = searcher.search()
+        assert p.block is not None and l.passes(p, examples, fuel)
+        assert p.block.children[0].children[0].children[1].length() == size
+        assert searcher.considered > 0
+    examples = [({"X": x}, {"Y": x**6, "Z": True}) for x in range(-2, 5)]
+    assert searchers.Bottom_Up_Searcher(l, p, examples, max_size=5).search() is None
+    with pytest.raises(Exception, match="at least one example"):
+        searchers.Bottom_Up_Searcher(l, p, [])
+
+def test_candidate_cache_forgets_outcomes_for_other_examples_and_budgets():
+    p = make_program()
+    cache = searchers.Candidate_Cache(capacity=2)
+    searcher = searchers.Searcher(l, p, cache)
+    right = Example_Set([({"X": x}, {"Y": x+1}) for x in inputs])
+    wrong = Example_Set([({"X": x}, {"Y": x+2}) for x in inputs])
+    fuel = Fuel(100)
+    assert searcher.passes(add_one(p), right, fuel)
+    assert searcher.passes(add_one(p), right, fuel)
+    assert cache.stats()["hits"] == 1 and len(cache) == 1
+    assert not searcher.passes(add_one(p), wrong, fuel)
+    assert len(cache) == 1 and cache.hits == 1
+    assert not searcher.passes(add_one(p), wrong, Fuel(200))
+    assert cache.hits == 1 and cache.budget == 200
+    # A candidate that draws a random number is run every time
+    y = Block(Sym.INT_LVAL)
+    y.var = p.outs[int][0]
+    noisy = Block(Sym.GETS, [Block(Sym.INT_BINDING, [y, Block(Sym.RAND_INT)])])
+    searcher.passes(noisy, wrong, Fuel(200))
+    assert len(cache) == 1
+    # Least recently used candidates go first
+    blocks = [add_one(p), Block(Sym.PASS), Block(Sym.WHILE, [Block(Sym.FALSE), Block(Sym.PASS)])]
+    for b in blocks:
+        searcher.passes(b, wrong, Fuel(200))
+    assert len(cache) == 2 and Flat_Block.from_block(blocks[0], p) not in cache
+    # Adding a local shifts every window, so an old key now names other
+    # variables and its outcome is forgotten
+    searcher.passes(add_one(p), right, fuel)
+    key = Flat_Block.from_block(add_one(p), p)
+    p.add_int_local()
+    shifted = key.to_block(p)
+    assert Flat_Block.from_block(shifted, p) == key
+    p.block = shifted
+    assert not l.passes(p, right, fuel)
+    assert not searcher.passes(shifted, right, fuel)